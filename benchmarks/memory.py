@@ -0,0 +1,120 @@
+
+# Measures how much memory a fully-loaded library occupies: every
+# component is loaded and its pins and package mappings are built, and
+# then the growth in the process's resident set is reported. Each
+# configuration runs in a fresh interpreter so they don't interfere.
+#
+#   python benchmarks/memory.py --library DIR [--config default ...]
+#
+# With --baseline, the default configuration is also measured against
+# another checkout of the repository (e.g. one made with git worktree
+# from an earlier commit), as "baseline", and each configuration's
+# ratio to it is reported:
+#
+#   git worktree add /tmp/icylib-before COMMIT
+#   python benchmarks/memory.py --library DIR --baseline /tmp/icylib-before
+
+import argparse
+import json
+import os
+import os.path
+import subprocess
+import sys
+
+
+CONFIGS = {
+    "default": {},
+    "lazy": {"lazy": True},
+    "compact": {"lazy": True, "compact": True},
+}
+
+SCRIPT = """
+import gc, json, os, resource, sys
+
+def resident_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError):
+        # Peak rather than current usage, but the best we can do.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+import icylib
+from icylib import model
+library_dir, options = sys.argv[1], json.loads(sys.argv[2])
+# Build the unit registry up front so it isn't counted.
+model.Package.for_spec("DIP-8")
+gc.collect()
+before = resident_bytes()
+library = icylib.open_library(library_dir, **options)
+components = list(library.components)
+pin_count = 0
+for component in components:
+    for pin_group in component.pin_groups.left + component.pin_groups.right:
+        pin_count += len(pin_group)
+    list(component.package_mappings)
+gc.collect()
+after = resident_bytes()
+json.dump({
+    "components": len(components),
+    "pins": pin_count,
+    "bytes": after - before,
+}, sys.stdout)
+"""
+
+
+def run_config(library_dir, options, repo_dir=None):
+    # Measures a configuration using the icylib in repo_dir, by default
+    # this checkout.
+    if repo_dir is None:
+        repo_dir = os.path.dirname(
+            os.path.dirname(os.path.abspath(__file__))
+        )
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [repo_dir] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", SCRIPT, library_dir, json.dumps(options)],
+        # With -c, the working directory comes first on sys.path.
+        env=env, cwd=repo_dir,
+    )
+    return json.loads(output.decode("utf-8"))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--library", required=True)
+    parser.add_argument(
+        "--config", action="append", choices=sorted(CONFIGS),
+    )
+    parser.add_argument("--baseline", default=None)
+    args = parser.parse_args(argv)
+
+    config_names = args.config or ["default", "compact"]
+    report = {}
+    for name in config_names:
+        report[name] = run_config(args.library, CONFIGS[name])
+    if args.baseline is not None:
+        # Only the default options, which any version of icylib accepts.
+        report["baseline"] = run_config(
+            args.library, CONFIGS["default"], args.baseline,
+        )
+    for name, result in report.items():
+        result["bytes_per_component"] = (
+            result["bytes"] / max(result["components"], 1)
+        )
+    for base_name in ("default", "baseline"):
+        if base_name not in report:
+            continue
+        for name, result in report.items():
+            result["ratio_to_" + base_name] = (
+                float(result["bytes"]) / max(report[base_name]["bytes"], 1)
+            )
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
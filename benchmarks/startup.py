@@ -0,0 +1,91 @@
+
+# Measures how long a fresh interpreter takes to import icylib (and,
+# optionally, to list the components of a library), and fails if that
+# exceeds a threshold or if importing icylib pulls in any of the slow
+# optional dependencies.
+#
+#   python benchmarks/startup.py --runs 20 --max-ms 50 [--library DIR]
+
+import argparse
+import json
+import os.path
+import subprocess
+import sys
+
+
+# Modules that must not be imported just by importing icylib.
+DEFERRED_MODULES = ("pint", "numpy")
+
+SCRIPT = """
+import sys, time, json
+start = time.time()
+import icylib
+import_time = time.time() - start
+list_time = None
+if len(sys.argv) > 1:
+    start = time.time()
+    library = icylib.open_library(sys.argv[1], lazy=True)
+    names = [c.name for c in library.components]
+    list_time = time.time() - start
+json.dump({
+    "import": import_time,
+    "list": list_time,
+    "modules": sorted(sys.modules),
+}, sys.stdout)
+"""
+
+
+def run_once(library_dir):
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    args = [sys.executable, "-c", SCRIPT]
+    if library_dir is not None:
+        args.append(library_dir)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [repo_dir] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+    output = subprocess.check_output(args, env=env)
+    return json.loads(output.decode("utf-8"))
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--library", default=None)
+    parser.add_argument("--max-ms", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    results = [run_once(args.library) for i in range(args.runs)]
+    report = {
+        "import_ms": median([r["import"] for r in results]) * 1000,
+        "deferred_modules_imported": [
+            name for name in DEFERRED_MODULES
+            if name in results[0]["modules"]
+        ],
+    }
+    if args.library is not None:
+        report["list_ms"] = median([r["list"] for r in results]) * 1000
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+
+    failed = False
+    if len(report["deferred_modules_imported"]) > 0:
+        sys.stderr.write("importing icylib imported %s\n" % ", ".join(
+            report["deferred_modules_imported"]
+        ))
+        failed = True
+    if args.max_ms is not None and report["import_ms"] > args.max_ms:
+        sys.stderr.write("import took %.1fms, over the %.1fms limit\n" % (
+            report["import_ms"], args.max_ms,
+        ))
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+
+# Times the main library operations against a synthetic library (see
+# synthetic.py) and writes the results as JSON. Each repeat runs in a
+# fresh interpreter, so "cold" loads don't benefit from anything cached
+# in-process (though the OS may still have the files cached), and the
+# fastest time of each benchmark across repeats is reported.
+#
+#   python benchmarks/suite.py --output results.json
+#   python benchmarks/suite.py --compare baseline.json --threshold 0.1
+#
+# With --compare, any benchmark that's more than the threshold slower
+# than in the baseline results is reported and the exit status is 1.
+
+import argparse
+import json
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from synthetic import generate_library
+
+
+SCRIPT = """
+import json, resource, sys, time
+
+import icylib
+from icylib import model
+from icylib.exporter import kicad
+
+
+class NullFile(object):
+
+    def write(self, text):
+        pass
+
+
+library_dir = sys.argv[1]
+timings = {}
+
+def timed(name, fn):
+    start = time.time()
+    result = fn()
+    timings[name] = time.time() - start
+    return result
+
+library = icylib.open_library(library_dir)
+components = timed("load_cold", lambda: list(library.components))
+components = timed("load_warm", lambda: list(library.components))
+timed("load_lazy", lambda: [
+    c.name for c in icylib.open_library(library_dir, lazy=True).components
+])
+
+specs = sorted(set(
+    spec for component in components for spec in component.package_specs
+))
+# Build the unit registry first so it isn't counted as construction time.
+model.unit.registry
+packages = timed(
+    "package_construction",
+    lambda: [model.Package(spec) for spec in specs],
+)
+timed(
+    "package_lookup",
+    lambda: [model.Package.for_spec(spec) for spec in specs * 10],
+)
+timed(
+    "export_eeschema_library",
+    lambda: kicad.export_eeschema_library(components, NullFile()),
+)
+timed(
+    "export_eeschema_doclib",
+    lambda: kicad.export_eeschema_doclib(components, NullFile()),
+)
+timed(
+    "export_pcbnew_module",
+    lambda: [kicad.export_pcbnew_module(p, NullFile()) for p in packages],
+)
+
+# ru_maxrss is in kilobytes on Linux, bytes on macOS.
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform != "darwin":
+    peak *= 1024
+json.dump({
+    "timings": timings,
+    "peak_memory_bytes": peak,
+    "components": len(components),
+    "packages": len(packages),
+}, sys.stdout)
+"""
+
+
+def run_once(library_dir):
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [repo_dir] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+    output = subprocess.check_output(
+        [sys.executable, "-c", SCRIPT, library_dir], env=env,
+    )
+    return json.loads(output.decode("utf-8"))
+
+
+def run_suite(library_dir, repeat):
+    runs = [run_once(library_dir) for i in range(repeat)]
+    timings = {}
+    for name in runs[0]["timings"]:
+        timings[name] = min(run["timings"][name] for run in runs)
+    return {
+        "timings": timings,
+        "peak_memory_bytes": max(run["peak_memory_bytes"] for run in runs),
+        "components": runs[0]["components"],
+        "packages": runs[0]["packages"],
+        "repeat": repeat,
+    }
+
+
+def compare(results, baseline, threshold):
+    # Returns a list of (benchmark, baseline value, new value) for every
+    # measurement that got worse by more than the threshold.
+    regressions = []
+    measurements = [
+        ("timings." + name, baseline["timings"].get(name), value)
+        for name, value in sorted(results["timings"].items())
+    ]
+    measurements.append((
+        "peak_memory_bytes",
+        baseline.get("peak_memory_bytes"),
+        results["peak_memory_bytes"],
+    ))
+    for name, old, new in measurements:
+        if old is None or old <= 0:
+            continue
+        if new > old * (1.0 + threshold):
+            regressions.append((name, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--library", default=None,
+        help="benchmark an existing library instead of a synthetic one",
+    )
+    parser.add_argument("--manufacturers", type=int, default=10)
+    parser.add_argument("--components", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    tmp_dir = None
+    library_dir = args.library
+    if library_dir is None:
+        tmp_dir = tempfile.mkdtemp(prefix="icylib-bench-")
+        library_dir = tmp_dir
+        generate_library(
+            library_dir, args.manufacturers, args.components, args.seed,
+        )
+    try:
+        results = run_suite(library_dir, args.repeat)
+    finally:
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir)
+    results["library"] = {
+        "path": args.library,
+        "manufacturers": args.manufacturers,
+        "components": args.components,
+        "seed": args.seed,
+    }
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+
+    if args.compare is None:
+        return 0
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for name, old, new in regressions:
+        sys.stderr.write("%s regressed: %g -> %g (%+.0f%%)\n" % (
+            name, old, new, ((new / old) - 1.0) * 100,
+        ))
+    return 1 if len(regressions) > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
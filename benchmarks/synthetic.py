@@ -0,0 +1,118 @@
+
+# Generates synthetic component libraries for benchmarking, with pins,
+# pin groups and package mappings across every supported package family.
+# The output only depends on the arguments, so runs are comparable.
+#
+#   python benchmarks/synthetic.py OUT_DIR --manufacturers 10 --components 100
+
+import argparse
+import json
+import os
+import os.path
+import random
+import sys
+
+
+ERC_CODES = ("powerIn", "powerOut", "input", "output", "bidirectional")
+
+# Pad counts to choose from, and the spec formats of the packages that
+# can have each number of pads.
+PAD_COUNTS = (4, 8, 14, 16, 20, 28, 32, 40, 44, 48, 64, 100, 144, 208)
+
+
+def package_specs_for(pad_count):
+    specs = []
+    if pad_count <= 12:
+        specs.append("SIP-%i" % pad_count)
+    if pad_count % 2 == 0 and pad_count <= 40:
+        specs.append("DIP-%i" % pad_count)
+        if pad_count >= 24:
+            specs.append("DIP-%i-600" % pad_count)
+    if pad_count % 2 == 0 and pad_count <= 28:
+        specs.append("SO-%i" % pad_count)
+        specs.append("SO-%i-W" % pad_count)
+    if pad_count % 4 == 0 and pad_count >= 32:
+        body = 7 if pad_count <= 48 else (14 if pad_count <= 100 else 28)
+        specs.append("QFP-%i-%i" % (pad_count, body))
+        specs.append("TQFP-%i-%i" % (pad_count, body))
+        specs.append("LQFP-%i-%i-0.5-0.3" % (pad_count, body))
+    return specs
+
+
+def generate_component(rng, pad_count):
+    labels = ["P%i" % i for i in range(pad_count - 2)]
+    if rng.random() < 0.3:
+        labels = ["~" + label if rng.random() < 0.2 else label for label in labels]
+
+    def pin_groups(labels):
+        groups = []
+        while len(labels) > 0:
+            size = rng.randint(1, 8)
+            groups.append([
+                {"label": label, "ercType": rng.choice(ERC_CODES)}
+                for label in labels[:size]
+            ])
+            labels = labels[size:]
+        return groups
+
+    half = len(labels) // 2
+    pins = {
+        "topPower": [[{"label": "VCC", "ercType": "powerIn"}]],
+        "bottomPower": [[{"label": "GND", "ercType": "powerIn"}]],
+        "left": pin_groups(labels[:half]),
+        "right": pin_groups(labels[half:]),
+    }
+
+    all_labels = ["VCC", "GND"] + labels
+    specs = package_specs_for(pad_count)
+    packages = {}
+    for spec in rng.sample(specs, min(len(specs), rng.randint(1, 3))):
+        pads = list(all_labels)
+        rng.shuffle(pads)
+        # Leave a few pads unconnected.
+        pads = [label if rng.random() < 0.95 else "" for label in pads]
+        packages[spec] = {"pads": pads}
+
+    return {
+        "description": "Synthetic %i-pin part" % pad_count,
+        "datasheetUrl": "http://example.com/datasheet.pdf",
+        "pins": pins,
+        "packages": packages,
+    }
+
+
+def generate_library(base_dir, manufacturers=10, components=100, seed=0):
+    # Writes manufacturers * components component files under
+    # base_dir/components, and returns the total number written.
+    rng = random.Random(seed)
+    count = 0
+    for i in range(manufacturers):
+        manufacturer_dir = os.path.join(base_dir, "components", "MFR%03i" % i)
+        if not os.path.isdir(manufacturer_dir):
+            os.makedirs(manufacturer_dir)
+        for j in range(components):
+            pad_count = rng.choice(PAD_COUNTS)
+            component = generate_component(rng, pad_count)
+            path = os.path.join(manufacturer_dir, "PART%05i.json" % j)
+            with open(path, "w") as f:
+                json.dump(component, f, indent=2, sort_keys=True)
+            count += 1
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir")
+    parser.add_argument("--manufacturers", type=int, default=10)
+    parser.add_argument("--components", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    count = generate_library(
+        args.out_dir, args.manufacturers, args.components, args.seed,
+    )
+    sys.stdout.write("Wrote %i components to %s\n" % (count, args.out_dir))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,5 +8,18 @@ __all__ = [
     "open_library",
 ]
 
-def open_library(base_dir):
-    return model.Library(base_dir)
+def open_library(
+    base_dir, index_path=None, workers=None, executor="thread", lazy=False,
+    compact=False, compiled_path=None, cache_size=None, cache_bytes=None,
+):
+    return model.Library(
+        base_dir,
+        index_path=index_path,
+        workers=workers,
+        executor=executor,
+        lazy=lazy,
+        compact=compact,
+        compiled_path=compiled_path,
+        cache_size=cache_size,
+        cache_bytes=cache_bytes,
+    )
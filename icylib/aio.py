@@ -0,0 +1,124 @@
+
+# asyncio counterparts of open_library and the Library iterators, for use
+# from an event loop. Directory listings and component file decoding
+# are run in an executor, with at most `concurrency` files being decoded
+# at once, and the components are the same Component objects (in the
+# same order) that the synchronous API gives.
+#
+# This needs Python 3.6 or later (for async generators), so unlike the
+# rest of icylib, which still runs on Python 2, it isn't imported by the
+# icylib package.
+#
+#   library = await icylib.aio.open_library(base_dir)
+#   async for component in library.components:
+#       ...
+
+import asyncio
+import collections
+import functools
+
+from icylib.model import Component, Library, load_component_file
+
+
+async def open_library(
+    base_dir, index_path=None, lazy=False, compact=False, compiled_path=None,
+    concurrency=8, executor=None,
+):
+    # Creating a Library with an index reads the index and brings it up
+    # to date, so that happens in the executor too. executor is a
+    # concurrent.futures.Executor, or None for the loop's default one.
+    loop = asyncio.get_event_loop()
+    library = await loop.run_in_executor(executor, functools.partial(
+        Library, base_dir, index_path=index_path, lazy=lazy, compact=compact,
+        compiled_path=compiled_path,
+    ))
+    return AsyncLibrary(library, concurrency=concurrency, executor=executor)
+
+
+class AsyncLibrary(object):
+
+    def __init__(self, library, concurrency=8, executor=None):
+        if concurrency < 1:
+            raise Exception("concurrency must be at least 1")
+        self.library = library
+        self.concurrency = concurrency
+        self.executor = executor
+
+    def _run(self, fn, *args):
+        loop = asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, fn, *args)
+
+    @property
+    def component_manufacturers(self):
+        return self._component_manufacturers()
+
+    async def _component_manufacturers(self):
+        manufacturers = await self._run(
+            list, self.library.component_manufacturers,
+        )
+        for manufacturer in manufacturers:
+            yield AsyncManufacturer(self, manufacturer)
+
+    @property
+    def components(self):
+        return self._components()
+
+    async def _components(self):
+        async for manufacturer in self.component_manufacturers:
+            async for component in manufacturer.components:
+                yield component
+
+    async def load_component_files(self, paths):
+        # Decodes each of the given files in the executor, yielding the
+        # results in order. Only `concurrency` files are queued at a time,
+        # and any still queued are cancelled if iteration stops early or
+        # the consuming task is cancelled.
+        pending = collections.deque()
+        try:
+            for path in paths:
+                pending.append(self._run(load_component_file, path))
+                if len(pending) >= self.concurrency:
+                    yield await pending.popleft()
+            while len(pending) > 0:
+                yield await pending.popleft()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+class AsyncManufacturer(object):
+
+    def __init__(self, library, manufacturer):
+        self.library = library
+        self.manufacturer = manufacturer
+        self.code = manufacturer.code
+
+    @property
+    def components(self):
+        return self._components()
+
+    async def _components(self):
+        manufacturer = self.manufacturer
+        library = manufacturer.library
+        if (
+            library.index is not None or library.compiled is not None or
+            library.lazy
+        ):
+            # These components don't each need a file read (and lazy ones
+            # aren't decoded yet), so the manufacturer's components are
+            # all gathered in one call to the executor.
+            components = await self.library._run(
+                list, manufacturer.components,
+            )
+            for component in components:
+                yield component
+            return
+        files = await self.library._run(list, manufacturer.component_files)
+        json_dicts = self.library.load_component_files(
+            [path for name, path in files]
+        )
+        i = 0
+        async for json_dict in json_dicts:
+            name, path = files[i]
+            yield Component(manufacturer, name, json_dict, path=path)
+            i += 1
@@ -0,0 +1,214 @@
+
+import json
+import mmap
+import struct
+import sys
+
+from icylib import stats
+from icylib.util import atomic_open
+
+
+# A compiled library packs every component of a library into a single
+# file, so it can be opened without listing or reading thousands of
+# small files:
+#
+#   header       magic, version, counts, and where the other parts are
+#   records      each component's JSON, one after another
+#   strings      the manufacturer codes, then the component names, each
+#                UTF-8 encoded and separated by NUL characters
+#   manufacturers  (index of first component, component count) for each
+#                manufacturer
+#   components   (record offset, record length) for each component
+#
+# Components are stored grouped by manufacturer, in the same order the
+# source library gives them. All integers are little-endian.
+
+MAGIC = b"ICYLIBC\0"
+VERSION = 1
+
+HEADER = struct.Struct("<8sIIIQQQ")
+MANUFACTURER_ENTRY = struct.Struct("<II")
+COMPONENT_ENTRY = struct.Struct("<QI")
+
+
+def compile_library(library, path):
+    # Writes every component in the library to a compiled library file at
+    # path, replacing it atomically. Returns the number of components.
+    codes = []
+    names = []
+    manufacturer_entries = []
+    component_entries = []
+    with atomic_open(path, "wb") as f:
+        # The header is filled in once everything else is written.
+        f.write(b"\0" * HEADER.size)
+        offset = HEADER.size
+        for manufacturer in library.component_manufacturers:
+            first = len(names)
+            for name, record in _component_records(library, manufacturer):
+                f.write(record)
+                component_entries.append((offset, len(record)))
+                names.append(name)
+                offset += len(record)
+            codes.append(manufacturer.code)
+            manufacturer_entries.append((first, len(names) - first))
+
+        strings = u"\0".join(codes + names).encode("utf-8")
+        strings_offset = offset
+        f.write(strings)
+        table_offset = strings_offset + len(strings)
+        for entry in manufacturer_entries:
+            f.write(MANUFACTURER_ENTRY.pack(*entry))
+        for entry in component_entries:
+            f.write(COMPONENT_ENTRY.pack(*entry))
+
+        f.seek(0)
+        f.write(HEADER.pack(
+            MAGIC, VERSION, len(codes), len(names),
+            strings_offset, len(strings), table_offset,
+        ))
+    return len(names)
+
+
+def _component_records(library, manufacturer):
+    # Yields (name, record) for each of the manufacturer's components.
+    # The records are copied byte for byte rather than re-encoded, so
+    # they decode to exactly what the source files do (including the
+    # order of their keys, which the exporters depend on).
+    if library.compiled is not None:
+        for component in manufacturer.components:
+            yield component.name, library.compiled.record(component.record)
+        return
+    for name, path in manufacturer.component_files:
+        with open(path, "rb") as f:
+            yield name, f.read()
+
+
+class CompiledLibrary(object):
+    # Serves a library's components from a compiled library file. The
+    # file is memory-mapped rather than read, and each component's record
+    # is only decoded when its contents are first needed. Components
+    # from a compiled library have no path, only a record number.
+
+    def __init__(self, library, path):
+        self.library = library
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.data) < HEADER.size:
+            raise Exception("'%s' is not a compiled library" % path)
+        (
+            magic, version, manufacturer_count, component_count,
+            strings_offset, strings_length, table_offset,
+        ) = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise Exception("'%s' is not a compiled library" % path)
+        if version != VERSION:
+            raise Exception(
+                "Unsupported compiled library version %i" % version
+            )
+
+        strings = self.data[
+            strings_offset:strings_offset + strings_length
+        ].decode("utf-8").split(u"\0")
+        if manufacturer_count + component_count == 0:
+            strings = []
+        self.codes = strings[:manufacturer_count]
+        self.names = strings[manufacturer_count:]
+        # (first component index, component count) for each manufacturer.
+        self.manufacturer_entries = [
+            MANUFACTURER_ENTRY.unpack_from(
+                self.data, table_offset + i * MANUFACTURER_ENTRY.size,
+            )
+            for i in range(manufacturer_count)
+        ]
+        self.components_offset = (
+            table_offset + manufacturer_count * MANUFACTURER_ENTRY.size
+        )
+        # For each manufacturer looked up by name so far, a dict of
+        # component name to record number.
+        self._records_by_name = {}
+
+    def close(self):
+        self.data.close()
+
+    @property
+    def component_manufacturers(self):
+        from icylib.model import Manufacturer
+        for code in self.codes:
+            yield Manufacturer(self.library, code, None)
+
+    def components_for(self, manufacturer):
+        from icylib.model import Component
+        for name, record in self.component_records(manufacturer):
+            yield Component(manufacturer, name, record=record)
+
+    def component_records(self, manufacturer):
+        # Yields (name, record number) for each of the manufacturer's
+        # components; the compiled counterpart of
+        # Manufacturer.component_files.
+        for i, code in enumerate(self.codes):
+            if code != manufacturer.code:
+                continue
+            first, count = self.manufacturer_entries[i]
+            for record in range(first, first + count):
+                yield self.names[record], record
+
+    def component(self, manufacturer_code, name):
+        # Returns the named component, or None if there's no such
+        # component.
+        from icylib.model import Component, Manufacturer
+        records_by_name = self._records_by_name.get(manufacturer_code)
+        if records_by_name is None:
+            if manufacturer_code not in self.codes:
+                return None
+            i = self.codes.index(manufacturer_code)
+            first, count = self.manufacturer_entries[i]
+            records_by_name = dict(
+                (self.names[record], record)
+                for record in range(first, first + count)
+            )
+            self._records_by_name[manufacturer_code] = records_by_name
+        record = records_by_name.get(name)
+        if record is None:
+            return None
+        manufacturer = Manufacturer(self.library, manufacturer_code, None)
+        return Component(manufacturer, name, record=record)
+
+    def record(self, record):
+        # The encoded JSON of the given component record.
+        offset, length = COMPONENT_ENTRY.unpack_from(
+            self.data, self.components_offset + record * COMPONENT_ENTRY.size,
+        )
+        return self.data[offset:offset + length]
+
+    def record_length(self, record):
+        return COMPONENT_ENTRY.unpack_from(
+            self.data, self.components_offset + record * COMPONENT_ENTRY.size,
+        )[1]
+
+    def load_component(self, record):
+        data = self.record(record)
+        with stats.timer("json_decode"):
+            return json.loads(data.decode("utf-8"))
+
+
+def main(argv=None):
+    # python -m icylib.compiled LIBRARY_DIR OUT_FILE
+    import argparse
+    from icylib.model import Library
+
+    parser = argparse.ArgumentParser(prog="python -m icylib.compiled")
+    parser.add_argument("library_dir")
+    parser.add_argument("out_file")
+    args = parser.parse_args(argv)
+
+    count = compile_library(Library(args.library_dir), args.out_file)
+    sys.stdout.write("Compiled %i components into %s\n" % (
+        count, args.out_file,
+    ))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+
+import json
+import os
+import os.path
+import threading
+
+from icylib.util import atomic_open
+
+
+class FragmentCache(object):
+    # Remembers the output an exporter produced for each item (a symbol,
+    # a footprint, ...) along with a hash of the inputs it was produced
+    # from, so that the next export only needs to render the items whose
+    # inputs have changed.
+    #
+    # Keys are "namespace:item", with a namespace for each kind of item,
+    # so that one cache can serve several exporters (including ones
+    # running at the same time in an ExportPipeline) without them
+    # forgetting each other's items.
+
+    version = 2
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.used = set()
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        self.entries = {}
+        try:
+            with open(self.path, 'r') as f:
+                cache_dict = json.load(f)
+        except (IOError, OSError, ValueError):
+            # Missing or corrupt cache; everything will be rendered again.
+            return
+        if cache_dict.get("version") != self.version:
+            return
+        self.entries = cache_dict.get("entries", {})
+
+    def prune(self, namespace):
+        # Forget the items in the namespace that weren't exported since it
+        # was last pruned, so removed items don't accumulate in the cache.
+        # An exporter calls this once it has been through all of its
+        # items, and only for its own namespace.
+        prefix = namespace + ":"
+        with self.lock:
+            self.entries = dict(
+                (key, entry) for key, entry in self.entries.items()
+                if key in self.used or not key.startswith(prefix)
+            )
+            self.used = set(
+                key for key in self.used if not key.startswith(prefix)
+            )
+
+    def save(self, namespace=None):
+        # Prunes the namespace, if one is given, and writes the cache.
+        if namespace is not None:
+            self.prune(namespace)
+        cache_dir = os.path.dirname(self.path)
+        if cache_dir != "" and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        with self.lock:
+            with atomic_open(self.path) as f:
+                json.dump({
+                    "version": self.version,
+                    "entries": self.entries,
+                }, f)
+
+    def is_current(self, key, input_hash):
+        with self.lock:
+            self.used.add(key)
+            entry = self.entries.get(key)
+        return entry is not None and entry["hash"] == input_hash
+
+    def get(self, key, input_hash):
+        # Returns the cached fragment for key, or None if there isn't one
+        # or it was rendered from different inputs.
+        with self.lock:
+            self.used.add(key)
+            entry = self.entries.get(key)
+        if entry is None or entry["hash"] != input_hash:
+            return None
+        return entry["fragment"]
+
+    def put(self, key, input_hash, fragment=None):
+        with self.lock:
+            self.used.add(key)
+            self.entries[key] = {
+                "hash": input_hash,
+                "fragment": fragment,
+            }
@@ -1,274 +1,631 @@
 
 import math
+import os
+import os.path
 
+from icylib import stats
+from icylib.exporter.layout import SymbolLayout
+from icylib.util import atomic_open, make_pool
 
-def export_eeschema_library(components, out_file):
-    out_file.write("EESchema-LIBRARY Version 2.3\n")
-    out_file.write("#encoding utf-8\n")
-    for component in components:
-        for package_mapping in component.package_mappings:
-            package = package_mapping.package
-            full_name = "-".join((component.name, package.name))
-            full_caption = "%s(%s)" % (component.name, package.name)
-            sides = [
-                [
-                    (
-                        component.pin_groups.top_power,
-                        component.pin_groups.left,
-                        component.pin_groups.bottom_power,
-                    ),
-                    [], # pins
-                    0, # max label length
-                    0, # x coord
-                    "R", # direction
-                ],
-                [
-                    (
-                        component.pin_groups.right,
-                    ),
-                    [], # pins
-                    0, # max label length
-                    0, # x coord
-                    "L", # direction
-                ]
-            ]
-            # Plan the layout
-            for side in sides:
-                pin_group_categories = side[0]
-                pins = side[1]
-                max_label_length = 0
-                for pin_group_category in pin_group_categories:
-                    for pin_group in pin_group_category:
-                        if len(pins) > 0 and pins[-1] is not None:
-                            pins.append(None)  # Leave a blank
-                        for pin in pin_group:
-                            if not package_mapping.has_pin(pin):
-                                continue
-                            pins.append(pin)
-                            plain_label = pin.label.replace("~", "")
-                            if len(plain_label) > max_label_length:
-                                max_label_length = len(plain_label)
-                side[2] = max_label_length
-                # Clean up trailing None that may have resulted from pins that
-                # are not available on the current package.
-                if len(pins) > 0 and pins[-1] is None:
-                    pins.pop()
-
-            # If the left side is shorter than the right side then
-            # we need to move the bottom power pins down to the bottom
-            # of the row.
-            if len(sides[0][1]) < len(sides[1][1]) and None in sides[0][1]:
-                move_from = len(sides[0][1]) - 1
-                move_to = len(sides[1][1]) - 1
-                sides[0][1].extend([None] * (move_to - move_from))
-                while True:
-                    if sides[0][1][move_from] is None:
-                        break
-                    sides[0][1][move_to] = sides[0][1][move_from]
-                    sides[0][1][move_from] = None
-                    move_to -= 1
-                    move_from -= 1
-
-            max_rows = max(len(sides[0][1]), len(sides[1][0]))
-
-            width = (sides[0][2] * 50) + (sides[1][2] * 50) + 150
-            if width < (len(full_caption) * 60):
-                width = len(full_caption) * 60
-            height = max_rows * 100 + 100
-
-            # Make sure width is a round grid increment.
-            # (it might not be if we grew out the width to fit the
-            # component caption)
-            width = int(math.ceil(float(width / 50)) * 50)
-
-            sides[1][3] = width
-
-            out_file.write("DEF %s IC 0 40 Y Y 1 F N\n" % full_name)
-            out_file.write("F0 \"IC\" %i %i 60 H V L CNN\n" % (
-                0, height + 50,
-            ))
-            out_file.write("F1 \"%s\" %i %i 60 H V R CNN\n" % (
-                full_caption,
-                width, -50,
-            ))
-            out_file.write("$FPLIST\nIC-%s\n$ENDFPLIST\n" % package.name)
-            out_file.write("DRAW\n")
-            # Outline Rectangle
-            out_file.write("S 0 0 %i %i 0 0 0 N\n" % (width, height))
-            # Pins
-            pin_length = 300
-            for side in sides:
-                pins = side[1]
-                direction = side[4]
-                xpos = side[3] + (pin_length if direction == "L" else -pin_length)
-                ypos = height - 100
-                for pin in pins:
-                    if pin is not None:
-                        pad_num = package_mapping.pad_number_for_pin(pin)
-                        # TODO: The hard-coded "B" on the end should
-                        # actually be set based on the pin's ERC type.
-                        # input I, output O, bidirectional B, W powerIn, w powerOut
-                        out_file.write("X %s %i %i %i %i %s 50 50 1 1 B\n" % (
-                            pin.label,
-                            pad_num,
-                            xpos,
-                            ypos,
-                            pin_length,
-                            direction,
-                        ))
-                    ypos = ypos - 100
-            out_file.write("ENDDRAW\n")
-            out_file.write("ENDDEF\n")
-    out_file.write("# End Library\n")
 
+# Bump this whenever a change to the exporters, or to the package
+# geometry they use, changes their output. It's part of the input hash
+# for incremental exports, so anything cached by an earlier version is
+# rendered again.
+EXPORTER_VERSION = 1
 
-def export_eeschema_doclib(components, out_file):
-    out_file.write("EESchema-DOCLIB Version 2.0\n")
-    out_file.write("#\n")
+# The FragmentCache namespaces of the symbol and footprint exporters.
+SYMBOL_CACHE_NAMESPACE = "symbol"
+MODULE_CACHE_NAMESPACE = "module"
+
+# The iter_* functions yield the output in chunks of roughly this many
+# characters.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def _chunked(texts, chunk_size):
+    # Joins up the many small strings the renderers produce into chunks
+    # of at least chunk_size characters (except for the last one), so
+    # consumers don't have to make a write call per line.
+    chunk = []
+    chunk_length = 0
+    for text in texts:
+        chunk.append(text)
+        chunk_length += len(text)
+        if chunk_length >= chunk_size:
+            yield "".join(chunk)
+            chunk = []
+            chunk_length = 0
+    if len(chunk) > 0:
+        yield "".join(chunk)
+
+
+def _write_chunks(chunks, out_file):
+    for chunk in chunks:
+        with stats.timer("write"):
+            out_file.write(chunk)
+
+
+def export_eeschema_library(components, out_file, cache=None):
+    with stats.timer("export_eeschema_library"):
+        _write_chunks(iter_eeschema_library(components, cache=cache), out_file)
+
+
+def iter_eeschema_library(
+    components, chunk_size=DEFAULT_CHUNK_SIZE, cache=None,
+):
+    # If a FragmentCache is given, each component's symbols are only
+    # rendered if the component has changed since they were cached.
+    return _chunked(_render_eeschema_library(components, cache), chunk_size)
+
+
+EESCHEMA_LIBRARY_HEADER = "EESchema-LIBRARY Version 2.3\n#encoding utf-8\n"
+EESCHEMA_LIBRARY_FOOTER = "# End Library\n"
+
+
+def _render_eeschema_library(components, cache):
+    yield EESCHEMA_LIBRARY_HEADER
     for component in components:
-        out_file.write("$CMP %s\n" % component.name)
-        out_file.write("D %s\n" % component.description)
-        out_file.write("$ENDCMP %s\n" % component.name)
-    out_file.write("#\n")
-    out_file.write("#End Doc Library\n")
+        for text in _render_eeschema_component(component, cache):
+            yield text
+    yield EESCHEMA_LIBRARY_FOOTER
+    if cache is not None:
+        cache.save(SYMBOL_CACHE_NAMESPACE)
 
 
-def export_pcbnew_module(package, out_file):
-    from icylib.model import unit
-    out_file.write("(module IC-%s\n" % package.name)
-    out_file.write("  (at 0 0)\n")
-    if package.hole_size is None:
-        out_file.write("  (attr smd)\n")
-
-    pad_sets = []
-    pad_sets.append(
-        [
-            package.left_pads,
-            (
-                0.0 * unit.mm,
-                ((len(package.left_pads) - 1) * package.pad_pitch) / -2,
-            ),
-            (0.0 * unit.mm, package.pad_pitch),
-            0.0,
-        ]
+def _render_eeschema_component(component, cache):
+    if cache is None:
+        for text in _render_eeschema_symbols(component):
+            yield text
+        return
+    key = "%s:%s/%s" % (
+        SYMBOL_CACHE_NAMESPACE, component.manufacturer.code, component.name,
+    )
+    input_hash = "%i:%s" % (EXPORTER_VERSION, component.content_hash)
+    fragment = cache.get(key, input_hash)
+    if fragment is not None:
+        stats.count("fragment_cache.hit")
+    else:
+        stats.count("fragment_cache.miss")
+        fragment = "".join(_render_eeschema_symbols(component))
+        cache.put(key, input_hash, fragment)
+    yield fragment
+
+
+def export_eeschema_library_sharded(
+    library, out_file=None, workers=None, executor="process", partition=None,
+    shard_count=None, manufacturer_dir=None,
+):
+    # Renders a library's symbols over a pool of workers, giving exactly
+    # the same output as export_eeschema_library(library.components, ...).
+    # The components are split into shards that each worker loads and
+    # renders by itself (so nothing but file paths and the rendered text
+    # cross between processes), and the shards are written out in order
+    # as they finish.
+    #
+    # partition is "size", for shard_count contiguous runs of components
+    # with about the same total file size (by default a few per worker,
+    # so that a slow shard doesn't hold up the rest), or "manufacturer"
+    # for one shard per manufacturer. If manufacturer_dir is given, each
+    # manufacturer's symbols are also written to their own
+    # <manufacturer code>.lib library in that directory, which implies
+    # partitioning by manufacturer. Returns the paths of those libraries.
+    if partition is None:
+        partition = "size" if manufacturer_dir is None else "manufacturer"
+    if partition not in ("size", "manufacturer"):
+        raise Exception("Unsupported partition '%s'" % partition)
+    if manufacturer_dir is not None and partition != "manufacturer":
+        raise Exception("Per-manufacturer libraries need manufacturer shards")
+    if shard_count is None:
+        shard_count = 4 * (workers or 1)
+
+    sources = list(_component_sources(library))
+    if partition == "manufacturer":
+        shards = []
+        for source in sources:
+            if len(shards) == 0 or shards[-1][0][0] != source[0]:
+                shards.append([])
+            shards[-1].append(source)
+    else:
+        shards = _balanced_shards(sources, shard_count)
+
+    if workers is not None and executor == "process":
+        # Worker processes open the library themselves.
+        library_source = _library_source(library)
+    else:
+        library_source = library
+    jobs = [
+        (library_source, [source[:3] for source in shard]) for shard in shards
+    ]
+
+    if manufacturer_dir is not None and not os.path.isdir(manufacturer_dir):
+        os.makedirs(manufacturer_dir)
+    paths = []
+    pool = None
+    if workers is None:
+        fragments = (_render_eeschema_shard(job) for job in jobs)
+    else:
+        pool = make_pool(workers, executor)
+        fragments = pool.imap(_render_eeschema_shard, jobs)
+    with stats.timer("export_eeschema_library"):
+        try:
+            if out_file is not None:
+                out_file.write(EESCHEMA_LIBRARY_HEADER)
+            for i, fragment in enumerate(fragments):
+                if out_file is not None:
+                    with stats.timer("write"):
+                        out_file.write(fragment)
+                if manufacturer_dir is not None:
+                    path = os.path.join(
+                        manufacturer_dir, "%s.lib" % shards[i][0][0],
+                    )
+                    with stats.timer("write"):
+                        with atomic_open(path) as f:
+                            f.write(EESCHEMA_LIBRARY_HEADER)
+                            f.write(fragment)
+                            f.write(EESCHEMA_LIBRARY_FOOTER)
+                    paths.append(path)
+            if out_file is not None:
+                out_file.write(EESCHEMA_LIBRARY_FOOTER)
+        finally:
+            if pool is not None:
+                pool.terminate()
+    return paths
+
+
+def _component_sources(library):
+    # Yields (manufacturer code, name, path, size) for every component in
+    # the library, in library order, without decoding any of them. For a
+    # compiled library the path is the record number.
+    compiled = library.compiled
+    for manufacturer in library.component_manufacturers:
+        if compiled is not None:
+            for name, record in compiled.component_records(manufacturer):
+                yield (
+                    manufacturer.code, name, record,
+                    compiled.record_length(record),
+                )
+            continue
+        for name, path in manufacturer.component_files:
+            yield manufacturer.code, name, path, os.path.getsize(path)
+
+
+def _library_source(library):
+    # What a worker process needs to open the library: its directory,
+    # and its compiled file with that file's identity, so a worker never
+    # reuses a library opened from an older compile of the same path.
+    if library.compiled is None:
+        return library.base_dir, None, None
+    path = library.compiled.path
+    stat = os.stat(path)
+    return library.base_dir, path, (
+        stat.st_dev, stat.st_ino, stat.st_mtime, stat.st_size,
     )
-    if package.right_pads is not None:
-        # Shift the left pads leftwards to center on the middle of the
-        # package.
-        left_pad_set = pad_sets[0]
-        left_pad_set[1] = (package.row_spacing / -2, left_pad_set[1][1])
-        # Populate the right pads.
-        pad_sets.append(
+
+
+def _balanced_shards(sources, shard_count):
+    # Splits the sources into at most shard_count contiguous runs of
+    # roughly equal total size.
+    total = sum(source[3] for source in sources)
+    shards = []
+    shard = []
+    size = 0
+    for source in sources:
+        shard.append(source)
+        size += source[3]
+        if size * shard_count >= total * (len(shards) + 1):
+            shards.append(shard)
+            shard = []
+    if len(shard) > 0:
+        shards.append(shard)
+    return shards
+
+
+# The library each worker process last opened in _shard_library, as
+# ((base dir, compiled path, compiled file identity), library), so a
+# worker only opens the library once however many shards it renders.
+_shard_library_entry = None
+
+
+def _shard_library(library_source):
+    global _shard_library_entry
+    from icylib.model import Library
+    if _shard_library_entry is not None:
+        source, library = _shard_library_entry
+        if source == library_source:
+            return library
+        _shard_library_entry = None
+        if library.compiled is not None:
+            library.compiled.close()
+    base_dir, compiled_path, identity = library_source
+    library = Library(base_dir, compiled_path=compiled_path)
+    _shard_library_entry = (library_source, library)
+    return library
+
+
+def _render_eeschema_shard(job):
+    # job is (library, sources) when rendering in this process, or
+    # (library source, sources) in a worker process (see _library_source).
+    from icylib.model import Component, Manufacturer
+    library, sources = job
+    if isinstance(library, tuple):
+        library = _shard_library(library)
+    manufacturers = {}
+    texts = []
+    for code, name, path in sources:
+        manufacturer = manufacturers.get(code)
+        if manufacturer is None:
+            manufacturer_dir = None
+            if library.compiled is None:
+                manufacturer_dir = os.path.join(library.components_dir, code)
+            manufacturer = Manufacturer(library, code, manufacturer_dir)
+            manufacturers[code] = manufacturer
+        if library.compiled is None:
+            component = Component(manufacturer, name, path=path)
+        else:
+            component = Component(manufacturer, name, record=path)
+        texts.extend(_render_eeschema_symbols(component))
+    return "".join(texts)
+
+
+def export_eeschema_symbols(component, out_file):
+    # Writes the symbol definitions (one per package) for a single
+    # component.
+    for text in _render_eeschema_symbols(component):
+        out_file.write(text)
+
+
+def _render_eeschema_symbols(component):
+    for package_mapping in component.package_mappings:
+        package = package_mapping.package
+        full_name = "-".join((component.name, package.name))
+        full_caption = "%s(%s)" % (component.name, package.name)
+        layout = SymbolLayout.for_mapping(package_mapping)
+        sides = [
             [
-                package.right_pads,
-                (package.row_spacing / 2.0, left_pad_set[1][1]),
-                (0.0 * unit.mm, package.pad_pitch),
-                0.0,
-            ]
-        )
-    if package.top_pads is not None:
-        pad_sets.append(
+                layout.left_pins,
+                layout.left_label_length,
+                0, # x coord
+                "R", # direction
+            ],
             [
-                package.top_pads,
-                (
-                    ((len(package.top_pads) - 1) * package.pad_pitch) / -2,
-                    package.row_spacing / -2.0,
-                ),
-                (package.pad_pitch, 0.0 * unit.mm),
-                90.0,
+                layout.right_pins,
+                layout.right_label_length,
+                0, # x coord
+                "L", # direction
             ]
+        ]
+
+        width = (sides[0][1] * 50) + (sides[1][1] * 50) + 150
+        if width < (len(full_caption) * 60):
+            width = len(full_caption) * 60
+        height = layout.rows * 100 + 100
+
+        # Make sure width is a round grid increment.
+        # (it might not be if we grew out the width to fit the
+        # component caption)
+        width = int(math.ceil(float(width // 50)) * 50)
+
+        sides[1][2] = width
+
+        yield "DEF %s IC 0 40 Y Y 1 F N\n" % full_name
+        yield "F0 \"IC\" %i %i 60 H V L CNN\n" % (
+            0, height + 50,
         )
-    if package.bottom_pads is not None:
-        pad_sets.append(
-            [
-                package.bottom_pads,
-                (
-                    ((len(package.bottom_pads) - 1) * package.pad_pitch) / -2,
-                    package.row_spacing / 2.0,
-                ),
-                (package.pad_pitch, 0.0 * unit.mm),
-                90.0,
-            ]
+        yield "F1 \"%s\" %i %i 60 H V R CNN\n" % (
+            full_caption,
+            width, -50,
         )
+        yield "$FPLIST\nIC-%s\n$ENDFPLIST\n" % package.name
+        yield "DRAW\n"
+        # Outline Rectangle
+        yield "S 0 0 %i %i 0 0 0 N\n" % (width, height)
+        # Pins
+        pin_length = 300
+        for side in sides:
+            pins = side[0]
+            direction = side[3]
+            xpos = side[2] + (pin_length if direction == "L" else -pin_length)
+            ypos = height - 100
+            for pin in pins:
+                if pin is not None:
+                    pad_num = package_mapping.pad_number_for_pin(pin)
+                    # TODO: The hard-coded "B" on the end should
+                    # actually be set based on the pin's ERC type.
+                    # input I, output O, bidirectional B, W powerIn, w powerOut
+                    yield "X %s %i %i %i %i %s 50 50 1 1 B\n" % (
+                        pin.label,
+                        pad_num,
+                        xpos,
+                        ypos,
+                        pin_length,
+                        direction,
+                    )
+                ypos = ypos - 100
+        yield "ENDDRAW\n"
+        yield "ENDDEF\n"
+
+
+def export_eeschema_doclib(components, out_file):
+    with stats.timer("export_eeschema_doclib"):
+        _write_chunks(iter_eeschema_doclib(components), out_file)
+
+
+def iter_eeschema_doclib(components, chunk_size=DEFAULT_CHUNK_SIZE):
+    return _chunked(_render_eeschema_doclib(components), chunk_size)
+
+
+EESCHEMA_DOCLIB_HEADER = "EESchema-DOCLIB Version 2.0\n#\n"
+EESCHEMA_DOCLIB_FOOTER = "#\n#End Doc Library\n"
+
+
+def _render_eeschema_doclib(components):
+    yield EESCHEMA_DOCLIB_HEADER
+    for component in components:
+        yield _render_eeschema_doc(component)
+    yield EESCHEMA_DOCLIB_FOOTER
 
-    silkscreen_box_height = (
-        ((len(package.left_pads) - 1) * package.pad_pitch) +
-        (package.silkscreen_overhang * 2.0)
+
+def _render_eeschema_doc(component):
+    return "$CMP %s\nD %s\n$ENDCMP %s\n" % (
+        component.name,
+        component.description,
+        component.name,
     )
-    silkscreen_box_width = package.silkscreen_overhang * 2
-    if package.right_pads is not None:
-        silkscreen_box_width = package.body_width
-    if package.top_pads is not None:
-        silkscreen_box_height = package.body_width
 
-    silkscreen_box_height_mm = silkscreen_box_height.to(unit.mm).magnitude
-    silkscreen_box_width_mm = silkscreen_box_width.to(unit.mm).magnitude
+
+def export_pcbnew_module(package, out_file):
+    with stats.timer("export_pcbnew_module"):
+        _write_chunks(iter_pcbnew_module(package), out_file)
+
+
+def iter_pcbnew_module(package, chunk_size=DEFAULT_CHUNK_SIZE):
+    return _chunked(_render_pcbnew_module(package), chunk_size)
+
+
+def _render_pcbnew_module(package):
+    layout = package.layout
+    yield "(module IC-%s\n" % package.name
+    yield "  (at 0 0)\n"
+    if package.hole_size is None:
+        yield "  (attr smd)\n"
+
+    silkscreen_box_height_mm = layout.silkscreen_height
+    silkscreen_box_width_mm = layout.silkscreen_width
 
     # Draw the silkscreen body box.
-    out_file.write("  (fp_line (start %f %f) (end %f %f) (layer F.SilkS) (width 0.2))\n" % (
+    yield "  (fp_line (start %f %f) (end %f %f) (layer F.SilkS) (width 0.2))\n" % (
         silkscreen_box_width_mm / -2.0, silkscreen_box_height_mm / -2.0,
         silkscreen_box_width_mm / -2.0, silkscreen_box_height_mm / 2.0,
-    ))
-    out_file.write("  (fp_line (start %f %f) (end %f %f) (layer F.SilkS) (width 0.2))\n" % (
+    )
+    yield "  (fp_line (start %f %f) (end %f %f) (layer F.SilkS) (width 0.2))\n" % (
         silkscreen_box_width_mm / -2.0, silkscreen_box_height_mm / 2.0,
         silkscreen_box_width_mm / 2.0, silkscreen_box_height_mm / 2.0,
-    ))
-    out_file.write("  (fp_line (start %f %f) (end %f %f) (layer F.SilkS) (width 0.2))\n" % (
+    )
+    yield "  (fp_line (start %f %f) (end %f %f) (layer F.SilkS) (width 0.2))\n" % (
         silkscreen_box_width_mm / 2.0, silkscreen_box_height_mm / -2.0,
         silkscreen_box_width_mm / 2.0, silkscreen_box_height_mm / 2.0,
-    ))
-    out_file.write("  (fp_line (start %f %f) (end %f %f) (layer F.SilkS) (width 0.2))\n" % (
+    )
+    yield "  (fp_line (start %f %f) (end %f %f) (layer F.SilkS) (width 0.2))\n" % (
         silkscreen_box_width_mm / -2.0, silkscreen_box_height_mm / -2.0,
         silkscreen_box_width_mm / 2.0, silkscreen_box_height_mm / -2.0,
-    ))
+    )
 
     if package.top_dent:
-        out_file.write("  (fp_arc (start %f %f) (end %f %f) (angle 180) (layer F.SilkS) (width 0.2))\n" % (
+        yield "  (fp_arc (start %f %f) (end %f %f) (angle 180) (layer F.SilkS) (width 0.2))\n" % (
             0.0, silkscreen_box_height_mm / -2.0,
             silkscreen_box_width_mm / 4.0, silkscreen_box_height_mm / -2.0,
-        ))
-
-    if package.pin_1_marker:
-        out_file.write("  (fp_arc (start %f %f) (end %f %f) (angle 360) (layer F.SilkS) (width 0.2))\n" % (
-            ((silkscreen_box_width / -2.0) + package.pad_pitch).to(unit.mm).magnitude,
-            ((silkscreen_box_height / -2.0) + package.pad_pitch).to(unit.mm).magnitude,
-            (((silkscreen_box_width / -2.0) + package.pad_pitch) + (package.pad_width / 2)).to(unit.mm).magnitude,
-            ((silkscreen_box_height / -2.0) + package.pad_pitch).to(unit.mm).magnitude,
-        ))
-
-    for pad_set in pad_sets:
-        next_x = pad_set[1][0]
-        next_y = pad_set[1][1]
-        for pad_num in pad_set[0]:
-            out_file.write("  (pad %i %s %s" % (
-                pad_num,
-                "thru_hole" if package.hole_size is not None else "smd",
-                "rect" if package.hole_size is None else (
-                    "rect" if pad_num == 1 else "circle"
-                ),
-            ))
-
-            out_file.write(" (at %f %f %f)" % (
-                next_x.to(unit.mm).magnitude,
-                next_y.to(unit.mm).magnitude,
-                pad_set[3],
-            ))
-            out_file.write(" (size %f %f)" % (
-                package.pad_length.to(unit.mm).magnitude,
-                package.pad_width.to(unit.mm).magnitude,
-            ))
-
-            if package.hole_size is not None:
-                out_file.write(" (drill %f)" % (
-                    package.hole_size.to(unit.mm).magnitude,
-                ))
-                out_file.write(" (layers *.Cu *.Mask F.SilkS)")
-            else:
-                out_file.write(" (layers F.Cu F.Mask F.SilkS)")
-
-            out_file.write(")\n")
-
-            next_x += pad_set[2][0]
-            next_y += pad_set[2][1]
-
-    out_file.write(")\n")
+        )
+
+    if layout.pin_1_marker is not None:
+        marker_x, marker_y, marker_edge_x = layout.pin_1_marker
+        yield "  (fp_arc (start %f %f) (end %f %f) (angle 360) (layer F.SilkS) (width 0.2))\n" % (
+            marker_x, marker_y, marker_edge_x, marker_y,
+        )
+
+    # Everything after the position is the same for every pad.
+    pad_suffix = " (size %f %f)" % (
+        package.pad_length_mm,
+        package.pad_width_mm,
+    )
+    if package.hole_size is not None:
+        pad_type = "thru_hole"
+        pad_suffix += " (drill %f)" % package.hole_size_mm
+        pad_suffix += " (layers *.Cu *.Mask F.SilkS)"
+    else:
+        pad_type = "smd"
+        pad_suffix += " (layers F.Cu F.Mask F.SilkS)"
+
+    for pad_num, x, y, angle in layout.pads:
+        yield "  (pad %i %s %s (at %f %f %f)%s)\n" % (
+            pad_num,
+            pad_type,
+            "rect" if package.hole_size is None else (
+                "rect" if pad_num == 1 else "circle"
+            ),
+            x,
+            y,
+            angle,
+            pad_suffix,
+        )
+
+    yield ")\n"
+
+
+def export_pcbnew_library(
+    components, out_dir, workers=None, executor="thread", cache=None,
+):
+    # Writes one IC-<package>.kicad_mod file into out_dir for every
+    # distinct package used by the given components, so a package that
+    # many components share is only generated once. Each file is replaced
+    # atomically. Returns the paths of all of the modules, in package name
+    # order.
+    #
+    # If a FragmentCache is given, modules that are already in out_dir
+    # and were written by the current exporter version are left alone.
+    package_names = set()
+    for component in components:
+        for package_mapping in component.package_mappings:
+            package_names.add(package_mapping.package.name)
+    package_names = sorted(package_names)
+
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+
+    paths = []
+    jobs = []
+    for name in package_names:
+        path = os.path.join(out_dir, pcbnew_module_filename(name))
+        paths.append(path)
+        if cache is not None and _pcbnew_module_is_current(cache, name, path):
+            continue
+        jobs.append((name, out_dir))
+
+    if workers is None:
+        for job in jobs:
+            _export_pcbnew_module_file(job)
+    elif len(jobs) > 0:
+        # Workers are given package specs rather than Package objects, so
+        # that nothing needs to be pickled for the process executor.
+        pool = make_pool(workers, executor)
+        try:
+            pool.map(_export_pcbnew_module_file, jobs)
+        finally:
+            pool.terminate()
+
+    if cache is not None:
+        cache.save(MODULE_CACHE_NAMESPACE)
+    return paths
+
+
+def _pcbnew_module_is_current(cache, name, path):
+    # Whether the module at path was written by the current exporter
+    # version. If not, it's recorded in the cache as about to be written.
+    # A module depends only on its package spec, which is its key.
+    key = "%s:%s" % (MODULE_CACHE_NAMESPACE, name)
+    input_hash = str(EXPORTER_VERSION)
+    if cache.is_current(key, input_hash) and os.path.exists(path):
+        stats.count("module_cache.hit")
+        return True
+    stats.count("module_cache.miss")
+    cache.put(key, input_hash)
+    return False
+
+
+def pcbnew_module_filename(package_name):
+    return "IC-%s.kicad_mod" % package_name
+
+
+def _export_pcbnew_module_file(job):
+    from icylib.model import Package
+    package_name, out_dir = job
+    path = os.path.join(out_dir, pcbnew_module_filename(package_name))
+    with atomic_open(path) as out_file:
+        export_pcbnew_module(Package.for_spec(package_name), out_file)
+    return path
+
+
+class _ChunkWriter(object):
+    # Collects text written to it into chunks of about chunk_size
+    # characters before passing them on to out_file.
+
+    def __init__(self, out_file, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.out_file = out_file
+        self.chunk_size = chunk_size
+        self.chunk = []
+        self.chunk_length = 0
+
+    def write(self, text):
+        self.chunk.append(text)
+        self.chunk_length += len(text)
+        if self.chunk_length >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if len(self.chunk) > 0:
+            with stats.timer("write"):
+                self.out_file.write("".join(self.chunk))
+            self.chunk = []
+            self.chunk_length = 0
+
+
+# Targets for icylib.exporter.pipeline.ExportPipeline, so a library can be
+# read once and exported to all of them. Each writes exactly what its
+# export_* function would for the same components.
+
+class EeschemaLibraryTarget(object):
+
+    def __init__(self, out_file, cache=None):
+        self.out_file = out_file
+        self.cache = cache
+        self.writer = None
+
+    def begin(self):
+        self.writer = _ChunkWriter(self.out_file)
+        self.writer.write(EESCHEMA_LIBRARY_HEADER)
+
+    def add(self, component):
+        for text in _render_eeschema_component(component, self.cache):
+            self.writer.write(text)
+
+    def finish(self):
+        self.writer.write(EESCHEMA_LIBRARY_FOOTER)
+        self.writer.flush()
+        if self.cache is not None:
+            # The pipeline saves the cache once every target is done.
+            self.cache.prune(SYMBOL_CACHE_NAMESPACE)
+
+
+class EeschemaDoclibTarget(object):
+
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.writer = None
+
+    def begin(self):
+        self.writer = _ChunkWriter(self.out_file)
+        self.writer.write(EESCHEMA_DOCLIB_HEADER)
+
+    def add(self, component):
+        self.writer.write(_render_eeschema_doc(component))
+
+    def finish(self):
+        self.writer.write(EESCHEMA_DOCLIB_FOOTER)
+        self.writer.flush()
+
+
+class PcbnewLibraryTarget(object):
+    # Writes each package's module as soon as the first component using
+    # it comes along. paths ends up as export_pcbnew_library would return.
+
+    def __init__(self, out_dir, cache=None):
+        self.out_dir = out_dir
+        self.cache = cache
+        self.package_names = set()
+        self.paths = []
+
+    def begin(self):
+        if not os.path.isdir(self.out_dir):
+            os.makedirs(self.out_dir)
+        self.package_names = set()
+
+    def add(self, component):
+        for package_mapping in component.package_mappings:
+            name = package_mapping.package.name
+            if name in self.package_names:
+                continue
+            self.package_names.add(name)
+            path = os.path.join(self.out_dir, pcbnew_module_filename(name))
+            if self.cache is not None and _pcbnew_module_is_current(
+                self.cache, name, path,
+            ):
+                continue
+            _export_pcbnew_module_file((name, self.out_dir))
+
+    def finish(self):
+        self.paths = [
+            os.path.join(self.out_dir, pcbnew_module_filename(name))
+            for name in sorted(self.package_names)
+        ]
+        if self.cache is not None:
+            self.cache.prune(MODULE_CACHE_NAMESPACE)
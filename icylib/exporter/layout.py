@@ -0,0 +1,107 @@
+
+import weakref
+
+from icylib import stats
+
+
+# Layouts already planned for each component, keyed by which of its pins
+# are available. Entries go away along with their components.
+_layouts_by_component = weakref.WeakKeyDictionary()
+
+
+class SymbolLayout(object):
+    # Where a component's pins go on a schematic symbol: power pins and
+    # the left pin groups down the left side, the right pin groups down
+    # the right, with a blank row between groups. This depends only on
+    # the component's pins and on which of them the package exposes, so
+    # it's shared between all of the component's packages that expose
+    # the same pins (see for_mapping). Layouts are shared, so they must
+    # not be modified.
+
+    def __init__(self, pin_groups, available_pins):
+        sides = [
+            [
+                (
+                    pin_groups.top_power,
+                    pin_groups.left,
+                    pin_groups.bottom_power,
+                ),
+                [], # pins
+                0, # max label length
+            ],
+            [
+                (
+                    pin_groups.right,
+                ),
+                [], # pins
+                0, # max label length
+            ]
+        ]
+        for side in sides:
+            pin_group_categories = side[0]
+            pins = side[1]
+            max_label_length = 0
+            for pin_group_category in pin_group_categories:
+                for pin_group in pin_group_category:
+                    if len(pins) > 0 and pins[-1] is not None:
+                        pins.append(None)  # Leave a blank
+                    for pin in pin_group:
+                        if not available_pins[pin.index]:
+                            continue
+                        pins.append(pin)
+                        plain_label = pin.label.replace("~", "")
+                        if len(plain_label) > max_label_length:
+                            max_label_length = len(plain_label)
+            side[2] = max_label_length
+            # Clean up trailing None that may have resulted from pins that
+            # are not available on the current package.
+            if len(pins) > 0 and pins[-1] is None:
+                pins.pop()
+
+        # If the left side is shorter than the right side then
+        # we need to move the bottom power pins down to the bottom
+        # of the row.
+        if len(sides[0][1]) < len(sides[1][1]) and None in sides[0][1]:
+            move_from = len(sides[0][1]) - 1
+            move_to = len(sides[1][1]) - 1
+            sides[0][1].extend([None] * (move_to - move_from))
+            while True:
+                if sides[0][1][move_from] is None:
+                    break
+                sides[0][1][move_to] = sides[0][1][move_from]
+                sides[0][1][move_from] = None
+                move_to -= 1
+                move_from -= 1
+
+        # Pin lists, with None for blank rows.
+        self.left_pins = tuple(sides[0][1])
+        self.right_pins = tuple(sides[1][1])
+        # Longest label on each side, not counting "~" overbar markers.
+        self.left_label_length = sides[0][2]
+        self.right_label_length = sides[1][2]
+        # The symbol height is based only on the left side's rows (the
+        # right side only ever counts as one row). Symbols have always
+        # been sized this way, so it's kept to avoid changing existing
+        # exports.
+        self.rows = max(len(self.left_pins), len(sides[1][0]))
+
+    @classmethod
+    def for_mapping(cls, package_mapping):
+        component = package_mapping.component
+        # Which of the component's pins (by index) the package has.
+        available_pins = tuple(
+            pad_number != 0 for pad_number in package_mapping.pad_numbers
+        )
+        layouts = _layouts_by_component.get(component)
+        if layouts is None:
+            layouts = {}
+            _layouts_by_component[component] = layouts
+        layout = layouts.get(available_pins)
+        if layout is not None:
+            stats.count("symbol_layout_cache.hit")
+        else:
+            stats.count("symbol_layout_cache.miss")
+            with stats.timer("symbol_layout"):
+                layout = cls(component.pin_groups, available_pins)
+            layouts[available_pins] = layout
+        return layout
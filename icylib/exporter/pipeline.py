@@ -0,0 +1,126 @@
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from icylib.util import make_pool
+
+
+# Marks the end of the components in a target's queue; _ABORT marks that
+# reading the components failed, so the target shouldn't finish.
+_END = object()
+_ABORT = object()
+
+
+class ExportPipeline(object):
+    # Reads a set of components once and hands each one to several export
+    # targets, e.g. to write a symbol library, its doc library and the
+    # footprints in one pass over a Library:
+    #
+    #   pipeline = ExportPipeline([
+    #       kicad.EeschemaLibraryTarget(lib_file),
+    #       kicad.EeschemaDoclibTarget(dcm_file),
+    #       kicad.PcbnewLibraryTarget(footprint_dir),
+    #   ])
+    #   pipeline.run(library.components)
+    #
+    # A target is any object with these methods, so new kinds of output
+    # can be added without changing the pipeline:
+    #
+    #   begin()           called before the first component
+    #   add(component)    called for each component, in order
+    #   finish()          called after the last component
+    #
+    # A target may also have a cache attribute, a FragmentCache (or None)
+    # that it only prunes in finish(). The pipeline saves each of the
+    # targets' caches once all of them have finished, so targets can
+    # share a cache without writing it once per target.
+    #
+    # With concurrent=True each target runs in its own thread, fed through
+    # a queue of at most queue_size components, so one target's writes
+    # can overlap with another's rendering and with reading the library.
+    # Each target still sees its components one at a time and in order.
+
+    def __init__(self, targets=(), concurrent=True, queue_size=64):
+        self.targets = list(targets)
+        self.concurrent = concurrent
+        self.queue_size = queue_size
+
+    def add_target(self, target):
+        self.targets.append(target)
+        return target
+
+    def run(self, components):
+        # Returns the number of components exported.
+        if not self.concurrent or len(self.targets) < 2:
+            return self._run_serial(components)
+
+        queues = [queue.Queue(self.queue_size) for target in self.targets]
+        pool = make_pool(len(self.targets), "thread")
+        try:
+            results = [
+                pool.apply_async(_run_target, (target, queues[i]))
+                for i, target in enumerate(self.targets)
+            ]
+            count = 0
+            end = _ABORT
+            try:
+                for component in components:
+                    for target_queue in queues:
+                        target_queue.put(component)
+                    count += 1
+                end = _END
+            finally:
+                for target_queue in queues:
+                    target_queue.put(end)
+            # Re-raises the first error from any of the targets.
+            for result in results:
+                result.get()
+        finally:
+            pool.terminate()
+        self._save_caches()
+        return count
+
+    def _run_serial(self, components):
+        for target in self.targets:
+            target.begin()
+        count = 0
+        for component in components:
+            for target in self.targets:
+                target.add(component)
+            count += 1
+        for target in self.targets:
+            target.finish()
+        self._save_caches()
+        return count
+
+    def _save_caches(self):
+        caches = []
+        for target in self.targets:
+            cache = getattr(target, "cache", None)
+            if cache is not None and cache not in caches:
+                caches.append(cache)
+        for cache in caches:
+            cache.save()
+
+
+def _run_target(target, target_queue):
+    ended = False
+    try:
+        target.begin()
+        while True:
+            component = target_queue.get()
+            if component is _END or component is _ABORT:
+                ended = True
+                break
+            target.add(component)
+        if component is _END:
+            target.finish()
+    except:
+        # Keep emptying the queue so the reader doesn't block on it, and
+        # then report the error.
+        while not ended:
+            component = target_queue.get()
+            ended = component is _END or component is _ABORT
+        raise
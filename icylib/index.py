@@ -0,0 +1,224 @@
+import json
+import mmap
+import os
+import os.path
+
+from icylib import stats
+from icylib.util import atomic_open
+
+
+# The fields of an index entry, which is a list so that an index of tens
+# of thousands of components stays small in memory.
+NAME, MTIME, SIZE, OFFSET, LENGTH, SUMMARY = range(6)
+
+
+class ComponentIndex(object):
+    # A manifest of every component file in a library, recording each
+    # file's mtime and size along with its contents. Once the index is up
+    # to date, components can be served without listing the manufacturer
+    # directories or reading their files again.
+    #
+    # The contents are kept as the files' text rather than as decoded
+    # JSON: re-encoding a decoded dict (and decoding it again) changes the
+    # order its keys iterate in on Python 2, which would change the order
+    # of each component's symbols in the exports.
+    #
+    # The index file is a line of JSON with the entries, followed by the
+    # texts one after another. Only the entries are decoded when the
+    # index is opened; the rest of the file is memory-mapped, and an
+    # entry's text is only read (through its offset and length) when its
+    # component is decoded. Each entry also keeps the component's summary
+    # (the values of Component.summary_keys), so a lazy library can list
+    # and document its components without reading any of the texts.
+
+    version = 4
+
+    def __init__(self, library, path):
+        self.library = library
+        self.path = path
+        # (manufacturers, data, texts offset): a list of (manufacturer
+        # code, [entry, ...]) in directory order, the mapped index file
+        # they came from, and where its texts start. These are always
+        # replaced together, so an entry is never read from a different
+        # version of the file.
+        self.contents = ([], b"", 0)
+        self.load()
+        self.refresh()
+
+    @property
+    def manufacturers(self):
+        return self.contents[0]
+
+    def load(self):
+        self.contents = ([], b"", 0)
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.readline()
+                index_dict = json.loads(header.decode("utf-8"))
+                data = b""
+                if os.fstat(f.fileno()).st_size > len(header):
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            # Missing or corrupt index; refresh will rebuild it.
+            return
+        if (
+            not isinstance(index_dict, dict) or
+            index_dict.get("version") != self.version or
+            index_dict.get("texts_length") != len(data) - len(header)
+        ):
+            return
+        try:
+            manufacturers = [
+                (code, entries)
+                for code, entries in index_dict.get("manufacturers", [])
+            ]
+        except (TypeError, ValueError):
+            return
+        self.contents = (manufacturers, data, len(header))
+
+    def save(self, manufacturers=None, texts=None):
+        # Writes the given manufacturers' entries (by default the current
+        # ones) to a new index file and switches over to it. texts holds
+        # the text of each entry (by id) that isn't in the current file.
+        if manufacturers is None:
+            manufacturers = self.manufacturers
+        if texts is None:
+            texts = {}
+        saved_manufacturers = []
+        saved_texts = []
+        offset = 0
+        for code, entries in manufacturers:
+            saved_entries = []
+            for entry in entries:
+                text = texts.get(id(entry))
+                if text is None:
+                    text = self.text(entry)
+                saved_entry = list(entry)
+                saved_entry[OFFSET] = offset
+                saved_entry[LENGTH] = len(text)
+                saved_entries.append(saved_entry)
+                saved_texts.append(text)
+                offset += len(text)
+            saved_manufacturers.append((code, saved_entries))
+        with atomic_open(self.path, 'wb') as f:
+            f.write(json.dumps({
+                "version": self.version,
+                "manufacturers": saved_manufacturers,
+                "texts_length": offset,
+            }).encode("utf-8"))
+            f.write(b"\n")
+            for text in saved_texts:
+                f.write(text)
+        self.load()
+
+    def text(self, entry, contents=None):
+        # The encoded contents of an entry's file, given the contents the
+        # entry came from (by default the current ones).
+        if contents is None:
+            contents = self.contents
+        manufacturers, data, texts_offset = contents
+        offset = texts_offset + entry[OFFSET]
+        return data[offset:offset + entry[LENGTH]]
+
+    def refresh(self):
+        # Bring the index in line with the components directory, decoding
+        # only the files that were added or changed since it was built.
+        # Returns True if anything changed.
+        old_entries = {}
+        for code, entries in self.manufacturers:
+            for entry in entries:
+                old_entries[(code, entry[NAME])] = entry
+
+        components_dir = self.library.components_dir
+        manufacturers = []
+        stale = []  # (entry, path) for entries that need reading
+        for code in os.listdir(components_dir):
+            manufacturer_dir = os.path.join(components_dir, code)
+            if not os.path.isdir(manufacturer_dir):
+                continue
+            entries = []
+            for filename in os.listdir(manufacturer_dir):
+                if filename[-5:] != ".json":
+                    continue
+                name = filename[:-5]
+                path = os.path.join(manufacturer_dir, filename)
+                stat = os.stat(path)
+                entry = old_entries.pop((code, name), None)
+                if (
+                    entry is None or
+                    entry[MTIME] != stat.st_mtime or
+                    entry[SIZE] != stat.st_size
+                ):
+                    entry = [name, stat.st_mtime, stat.st_size, 0, 0, None]
+                    stale.append((entry, path))
+                entries.append(entry)
+            manufacturers.append((code, entries))
+
+        # Read the new and changed files in one batch, so they can be
+        # spread over the library's worker pool if it has one.
+        texts = {}
+        stale_texts = self.library.read_component_files(
+            [path for entry, path in stale]
+        )
+        from icylib.model import Component
+        for i, text in enumerate(stale_texts):
+            entry = stale[i][0]
+            texts[id(entry)] = text
+            with stats.timer("json_decode"):
+                json_dict = json.loads(text.decode("utf-8"))
+            entry[SUMMARY] = [
+                json_dict.get(key) for key in Component.summary_keys
+            ]
+        entry_count = sum(len(entries) for code, entries in manufacturers)
+        stats.count("index.hit", entry_count - len(stale))
+        stats.count("index.miss", len(stale))
+
+        # Anything left over in old_entries was removed from disk.
+        changed = len(stale) > 0 or len(old_entries) > 0
+
+        if changed:
+            self.save(manufacturers, texts)
+        else:
+            self.contents = (manufacturers,) + self.contents[1:]
+        return changed
+
+    @property
+    def component_manufacturers(self):
+        from icylib.model import Manufacturer
+        for code, entries in self.manufacturers:
+            manufacturer_dir = os.path.join(self.library.components_dir, code)
+            yield Manufacturer(self.library, code, manufacturer_dir)
+
+    def components_for(self, manufacturer):
+        contents = self.contents
+        for code, entries in contents[0]:
+            if code != manufacturer.code:
+                continue
+            for entry in entries:
+                yield self._component_for(manufacturer, entry, contents)
+
+    def component(self, manufacturer, name):
+        # Returns the manufacturer's component with the given name, or
+        # None, decoding only that component's text.
+        contents = self.contents
+        for code, entries in contents[0]:
+            if code != manufacturer.code:
+                continue
+            for entry in entries:
+                if entry[NAME] == name:
+                    return self._component_for(manufacturer, entry, contents)
+        return None
+
+    def _component_for(self, manufacturer, entry, contents):
+        from icylib.model import Component
+        name = entry[NAME]
+        path = os.path.join(manufacturer.base_dir, name + ".json")
+        if self.library.lazy:
+            # Lazy components decode their files only when more than the
+            # summary is needed.
+            summary = dict(zip(Component.summary_keys, entry[SUMMARY]))
+            return Component(manufacturer, name, path=path, summary=summary)
+        text = self.text(entry, contents)
+        with stats.timer("json_decode"):
+            json_dict = json.loads(text.decode("utf-8"))
+        return Component(manufacturer, name, json_dict, path=path)
@@ -1,16 +1,106 @@
 
 import os
 import os.path
-import pint
+import threading
 
+from icylib import stats
+from icylib.util import LRUCache, make_pool
 
-unit = pint.UnitRegistry()
+
+class LazyUnitRegistry(object):
+    # Stands in for a pint UnitRegistry, only importing pint and building
+    # the real registry the first time a unit is looked up. Building the
+    # registry means parsing all of pint's unit definitions, which would
+    # otherwise dominate the time it takes to import icylib.
+
+    def __init__(self):
+        self._registry = None
+        self._lock = threading.Lock()
+
+    @property
+    def registry(self):
+        if self._registry is None:
+            with self._lock:
+                if self._registry is None:
+                    with stats.timer("unit_registry"):
+                        import pint
+                        self._registry = pint.UnitRegistry()
+        return self._registry
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.registry, name)
+
+    def __call__(self, *args, **kwargs):
+        return self.registry(*args, **kwargs)
+
+
+unit = LazyUnitRegistry()
+
+# Shared Package instances by spec string; see Package.for_spec.
+package_cache = LRUCache(maxsize=1024)
+
+
+def load_component_file(path):
+    import json
+    with stats.timer("json_decode"):
+        with open(path, 'r') as f:
+            return json.load(f)
+
+
+def read_component_file(path):
+    # A component file's contents, undecoded. Decoding them with
+    # json.loads gives exactly what load_component_file does; in
+    # particular, on Python 2 the dicts iterate in the same order, which
+    # isn't true of a dict that's been re-encoded (or pickled) and
+    # decoded again.
+    with open(path, 'rb') as f:
+        return f.read()
 
 
 class Library(object):
 
-    def __init__(self, base_dir):
+    # Number of files handed to each pool worker at a time when
+    # loading in parallel.
+    load_chunk_size = 8
+
+    def __init__(
+        self, base_dir, index_path=None, workers=None, executor="thread",
+        lazy=False, compact=False, compiled_path=None, cache_size=None,
+        cache_bytes=None,
+    ):
+        if executor not in ("thread", "process"):
+            raise Exception("Unsupported executor '%s'" % executor)
+        if index_path is not None and compiled_path is not None:
+            raise Exception("A compiled library can't have an index")
         self.base_dir = base_dir
+        self.workers = workers
+        self.executor = executor
+        self.lazy = lazy
+        self.compact = compact
+        self.index = None
+        if index_path is not None:
+            from icylib.index import ComponentIndex
+            self.index = ComponentIndex(self, index_path)
+        # Serves the components from a single compiled file (see
+        # icylib.compiled) instead of the components directory, in which
+        # case base_dir isn't used.
+        self.compiled = None
+        if compiled_path is not None:
+            from icylib.compiled import CompiledLibrary
+            self.compiled = CompiledLibrary(self, compiled_path)
+        # Keeps up to cache_size of the components loaded from the
+        # components directory, and/or as many as have files adding up to
+        # cache_bytes (their size in memory is roughly proportional), so
+        # they aren't decoded again while their files are unchanged.
+        # Each entry is ((mtime, size), component), keyed by path; the
+        # components hold on to their package mappings once built.
+        self.component_cache = None
+        if cache_size is not None or cache_bytes is not None:
+            self.component_cache = LRUCache(
+                maxsize=cache_size, maxbytes=cache_bytes,
+            )
 
     @property
     def components_dir(self):
@@ -18,16 +108,166 @@ class Library(object):
 
     @property
     def component_manufacturers(self):
-        for code in os.listdir(self.components_dir):
+        if self.index is not None:
+            for manufacturer in self.index.component_manufacturers:
+                yield manufacturer
+            return
+        if self.compiled is not None:
+            for manufacturer in self.compiled.component_manufacturers:
+                yield manufacturer
+            return
+        with stats.timer("list_dir"):
+            codes = os.listdir(self.components_dir)
+        for code in codes:
             manufacturer_dir = os.path.join(self.components_dir, code)
             if os.path.isdir(manufacturer_dir):
                 yield Manufacturer(self, code, manufacturer_dir)
 
     @property
     def components(self):
+        if (
+            self.workers is None or self.index is not None or self.lazy or
+            self.compiled is not None
+        ):
+            for manufacturer in self.component_manufacturers:
+                for component in manufacturer.components:
+                    yield component
+            return
+
+        # Gather the files across all manufacturers up front so the
+        # whole library can be spread over the pool at once.
+        files = []
         for manufacturer in self.component_manufacturers:
-            for component in manufacturer.components:
+            for name, path in manufacturer.component_files:
+                files.append((manufacturer, name, path))
+        for component in self.load_components(files):
+            yield component
+
+    def component(self, manufacturer_code, name):
+        # Returns a single component, or None if there's no such
+        # component.
+        if self.compiled is not None:
+            return self.compiled.component(manufacturer_code, name)
+        for manufacturer in self.component_manufacturers:
+            if manufacturer.code != manufacturer_code:
+                continue
+            if self.index is not None:
+                return self.index.component(manufacturer, name)
+            path = os.path.join(manufacturer.base_dir, name + ".json")
+            if not os.path.isfile(path):
+                return None
+            if self.lazy:
+                return Component(manufacturer, name, path=path)
+            # A single file is decoded here rather than in the worker
+            # pool (see load_component_files).
+            files = [(manufacturer, name, path)]
+            for component in self.load_components(files):
+                return component
+        return None
+
+    def watch(self, callback, interval=1.0, debounce=0.25, use_inotify=None):
+        # Starts a LibraryWatcher (see icylib.watch) that keeps a copy of
+        # the components up to date and reports changes to callback.
+        from icylib.watch import LibraryWatcher
+        return LibraryWatcher(
+            self, callback, interval=interval, debounce=debounce,
+            use_inotify=use_inotify,
+        ).start()
+
+    def load_component(self, component):
+        # Decodes a component's file, or its record if it's from a
+        # compiled library.
+        if component.record is not None:
+            return self.compiled.load_component(component.record)
+        return load_component_file(component.path)
+
+    def load_components(self, files):
+        # Yields a Component for each (manufacturer, name, path), decoding
+        # the files in one batch (see load_component_files), except those
+        # in the component cache that haven't changed since.
+        cache = self.component_cache
+        if cache is None:
+            json_dicts = self.load_component_files([f[2] for f in files])
+            for i, json_dict in enumerate(json_dicts):
+                manufacturer, name, path = files[i]
+                yield Component(manufacturer, name, json_dict, path=path)
+            return
+
+        components = []
+        versions = []
+        misses = []
+        for manufacturer, name, path in files:
+            stat = os.stat(path)
+            version = (stat.st_mtime, stat.st_size)
+            entry = cache.get(path, valid=lambda entry: entry[0] == version)
+            components.append(entry[1] if entry is not None else None)
+            versions.append(version)
+            if entry is None:
+                misses.append(path)
+        stats.count("component_cache.hit", len(files) - len(misses))
+        stats.count("component_cache.miss", len(misses))
+
+        json_dicts = self.load_component_files(misses)
+        try:
+            for i, component in enumerate(components):
+                if component is None:
+                    manufacturer, name, path = files[i]
+                    component = Component(
+                        manufacturer, name, next(json_dicts), path=path,
+                    )
+                    cache.put(
+                        path, (versions[i], component), size=versions[i][1],
+                    )
                 yield component
+        finally:
+            json_dicts.close()
+
+    def read_component_files(self, paths):
+        # Like load_component_files, but yields the files' undecoded
+        # contents (see read_component_file).
+        if self.workers is None or len(paths) < 2:
+            for path in paths:
+                yield read_component_file(path)
+            return
+
+        pool = make_pool(self.workers, self.executor)
+        try:
+            texts = pool.imap(
+                read_component_file, paths, self.load_chunk_size,
+            )
+            for text in texts:
+                yield text
+        finally:
+            pool.terminate()
+
+    def load_component_files(self, paths):
+        # Decode each of the given component files, yielding the results
+        # in the same order as the paths regardless of which worker
+        # finished first. A single file isn't worth starting the worker
+        # pool for, so it's always decoded here.
+        if self.workers is None or len(paths) < 2:
+            for path in paths:
+                yield load_component_file(path)
+            return
+        if self.executor == "process":
+            # Dicts pickled back from worker processes iterate in a
+            # different order (see read_component_file), so the workers
+            # only read the files and they're decoded here.
+            import json
+            for text in self.read_component_files(paths):
+                with stats.timer("json_decode"):
+                    yield json.loads(text)
+            return
+
+        pool = make_pool(self.workers, self.executor)
+        try:
+            json_dicts = pool.imap(
+                load_component_file, paths, self.load_chunk_size,
+            )
+            for json_dict in json_dicts:
+                yield json_dict
+        finally:
+            pool.terminate()
 
 
 class Manufacturer(object):
@@ -39,42 +279,221 @@ class Manufacturer(object):
 
     @property
     def components(self):
-        for filename in os.listdir(self.base_dir):
+        if self.library.index is not None:
+            for component in self.library.index.components_for(self):
+                yield component
+            return
+        if self.library.compiled is not None:
+            for component in self.library.compiled.components_for(self):
+                yield component
+            return
+        if self.library.lazy:
+            # Lazy components decode their files only when their
+            # contents are first needed.
+            for name, path in self.component_files:
+                yield Component(self, name, path=path)
+            return
+        files = [(self, name, path) for name, path in self.component_files]
+        for component in self.library.load_components(files):
+            yield component
+
+    @property
+    def component_files(self):
+        if self.base_dir is None:
+            raise Exception(
+                "Manufacturer '%s' is from a compiled library, which has no "
+                "component files (see CompiledLibrary.component_records)" %
+                self.code
+            )
+        with stats.timer("list_dir"):
+            filenames = os.listdir(self.base_dir)
+        for filename in filenames:
             if filename[-5:] != ".json":
                 continue
             name = filename[:-5]
-            f = open(os.path.join(self.base_dir, filename), 'r')
-            yield Component.from_file(self, name, f)
+            yield name, os.path.join(self.base_dir, filename)
 
 
 class Component(object):
 
-    def __init__(self, manufacturer, name, json_dict):
+    __slots__ = (
+        "name",
+        "manufacturer",
+        "path",
+        "record",
+        "_json_dict",
+        "_summary",
+        "_pin_groups",
+        "_package_table",
+        "_package_mappings",
+        "_content_hash",
+        "_pads_by_pin",
+        "__weakref__",
+    )
+
+    # The fields a lazy component keeps from its first pass over its
+    # file, so listings and docs don't hold on to the whole decoded
+    # file or build any pin objects.
+    summary_keys = ("description", "datasheetUrl")
+
+    def __init__(
+        self, manufacturer, name, json_dict=None, path=None, summary=None,
+        record=None,
+    ):
+        if json_dict is None and path is None and record is None:
+            raise Exception("Component needs json_dict, path or record")
         self.name = name
-        self.json_dict = json_dict
         self.manufacturer = manufacturer
-        pins_dict = self.json_dict.get("pins", {})
-        self.pin_groups = ComponentPinGroups(self, pins_dict)
+        # The component's file, if it has one, or its record number if
+        # it's from a compiled library.
+        self.path = path
+        self.record = record
+        self._json_dict = json_dict
+        # The summary_keys fields, if they're known without decoding the
+        # file (e.g. from an index).
+        self._summary = summary
+        self._pin_groups = None
+        # Tuple of (package spec, pad labels), from the "packages" dict.
+        self._package_table = None
+        self._package_mappings = None
+        self._content_hash = None
+        self._pads_by_pin = None
 
     @classmethod
     def from_file(cls, manufacturer, name, f):
         import json
         return Component(manufacturer, name, json.load(f))
 
+    @property
+    def compact(self):
+        # Compact components let go of their decoded JSON once they've
+        # built their pin and package tables, and read it from their file
+        # again if it's needed after that.
+        return (
+            (self.path is not None or self.record is not None) and
+            self.manufacturer.library.compact
+        )
+
+    @property
+    def json_dict(self):
+        json_dict = self._json_dict
+        if json_dict is None:
+            json_dict = self.manufacturer.library.load_component(self)
+            if not self.compact:
+                self._json_dict = json_dict
+                self._summary = None
+        return json_dict
+
+    @property
+    def summary(self):
+        if self._json_dict is not None:
+            return self._json_dict
+        if self._summary is None:
+            self._summary = Component.summarize(
+                self.manufacturer.library.load_component(self)
+            )
+        return self._summary
+
+    @classmethod
+    def summarize(cls, json_dict):
+        return {
+            key: json_dict.get(key) for key in cls.summary_keys
+        }
+
+    def _build_tables(self):
+        json_dict = self.json_dict
+        self._pin_groups = ComponentPinGroups(self, json_dict.get("pins", {}))
+        self._package_table = tuple(
+            (name, tuple(
+                intern_string(label) for label in mapping_dict.get("pads", [])
+            ))
+            for name, mapping_dict in json_dict.get("packages", {}).items()
+        )
+        if self.compact:
+            self._summary = Component.summarize(json_dict)
+            self._json_dict = None
+
+    @property
+    def pin_groups(self):
+        if self._pin_groups is None:
+            self._build_tables()
+        return self._pin_groups
+
+    @property
+    def pins_by_label(self):
+        return self.pin_groups.by_label
+
+    @property
+    def pads_by_pin(self):
+        # For each pin, a dict of package spec to the tuple of pad numbers
+        # the pin is on in that package (a pin can be on several pads,
+        # e.g. GND). Pins that aren't on any pads of a package don't
+        # appear in its entry.
+        if self._pads_by_pin is None:
+            pads_by_pin = {}
+            for pin in self.pin_groups.pins:
+                pads_by_pin[pin] = {}
+            for package_mapping in self.package_mappings:
+                package_name = package_mapping.package.name
+                for pad_number, pin in package_mapping.pins_by_pad.items():
+                    pads_by_pin[pin].setdefault(package_name, []).append(
+                        pad_number
+                    )
+            for pads_by_package in pads_by_pin.values():
+                for package_name, pad_numbers in pads_by_package.items():
+                    pads_by_package[package_name] = tuple(sorted(pad_numbers))
+            self._pads_by_pin = pads_by_pin
+        return self._pads_by_pin
+
+    @property
+    def content_hash(self):
+        # A digest of the component's source JSON as stored, which changes
+        # whenever anything about the component (other than its name)
+        # does, including the order of its keys: the order of its symbols
+        # follows the order of its packages.
+        if self._content_hash is None:
+            import hashlib
+            self._content_hash = hashlib.sha1(self.source).hexdigest()
+        return self._content_hash
+
+    @property
+    def source(self):
+        # The component's encoded JSON: its file, or its record if it's
+        # from a compiled library. A component with neither only has its
+        # decoded JSON, which is encoded in its own key order instead.
+        if self.record is not None:
+            return self.manufacturer.library.compiled.record(self.record)
+        if self.path is not None:
+            return read_component_file(self.path)
+        import json
+        return json.dumps(self.json_dict).encode("utf-8")
+
     @property
     def description(self):
-        return self.json_dict.get("description")
+        return self.summary.get("description")
 
     @property
     def datasheet_url(self):
-        return self.json_dict.get("datasheetUrl")
+        return self.summary.get("datasheetUrl")
+
+    @property
+    def package_specs(self):
+        # The package specs this component comes in, without parsing them
+        # into Package objects.
+        if self._package_table is None:
+            self._build_tables()
+        return tuple(name for name, pads in self._package_table)
 
     @property
     def package_mappings(self):
-        packages_dict = self.json_dict.get("packages", {})
-        for name, mapping_dict in packages_dict.iteritems():
-            package = Package(name)
-            yield PackageMapping(self, package, mapping_dict)
+        if self._package_mappings is None:
+            if self._package_table is None:
+                self._build_tables()
+            self._package_mappings = tuple(
+                PackageMapping(self, Package.for_spec(name), {"pads": pads})
+                for name, pads in self._package_table
+            )
+        return iter(self._package_mappings)
 
     def __repr__(self):
         return "<icylib.Component %s %s>" % (
@@ -83,68 +502,117 @@ class Component(object):
         )
 
 
+# Pin labels and ERC codes come from a small vocabulary ("GND", "VCC",
+# "input", ...) repeated across every component, so each distinct string
+# is only kept once. (The intern builtin won't take unicode strings on
+# Python 2, which is what the JSON decoder produces.)
+_interned_strings = {}
+
+
+def intern_string(value):
+    return _interned_strings.setdefault(value, value)
+
+
 class ComponentPinGroups(object):
 
+    __slots__ = ("component", "pins", "by_label", "categories")
+
     def __init__(self, component, pins_dict):
         self.component = component
-        self.pins_dict = pins_dict
 
-        pins = {}
+        # All of the component's pins in order; each pin's index is its
+        # position in this tuple.
+        pins = []
+        self.categories = {}
 
         # Build a mapping of pin label to pin object ahead of time,
         # so callers can access pins both by name and by browsing
         # the groups.
+        self.by_label = {}
+
         category_names = ("topPower", "bottomPower", "left", "right")
         for category_name in category_names:
             if category_name not in pins_dict:
                 continue
 
-            pin_groups = pins_dict[category_name]
-            for pin_group in pin_groups:
-                for i, pin_dict in enumerate(pin_group):
-                    pin = ComponentPin(component, pin_group[i])
-                    pin_group[i] = pin
-                    pins[pin.label] = pin
+            pin_groups = []
+            for pin_group_dicts in pins_dict[category_name]:
+                pin_group = []
+                for pin_dict in pin_group_dicts:
+                    pin = ComponentPin(
+                        component,
+                        len(pins),
+                        pin_dict.get("label"),
+                        pin_dict.get("ercType"),
+                    )
+                    pin_group.append(pin)
+                    pins.append(pin)
+                    self.by_label[pin.label] = pin
+                pin_groups.append(tuple(pin_group))
+            self.categories[category_name] = tuple(pin_groups)
+
+        self.pins = tuple(pins)
 
     @property
     def top_power(self):
-        return self.pins_dict.get("topPower", [])
+        return self.categories.get("topPower", ())
 
     @property
     def bottom_power(self):
-        return self.pins_dict.get("bottomPower", [])
+        return self.categories.get("bottomPower", ())
 
     @property
     def left(self):
-        return self.pins_dict.get("left", [])
+        return self.categories.get("left", ())
 
     @property
     def right(self):
-        return self.pins_dict.get("right", [])
+        return self.categories.get("right", ())
 
 
 class ComponentPin(object):
 
-    def __init__(self, component, pin_dict):
-        self.component = component
-        self.pin_dict = pin_dict
+    __slots__ = ("component", "index", "label", "erc_code")
 
-    @property
-    def label(self):
-        return self.pin_dict.get("label")
+    def __init__(self, component, index, label, erc_code):
+        self.component = component
+        self.index = index
+        self.label = intern_string(label)
+        self.erc_code = intern_string(erc_code)
 
     @property
     def erc_type(self):
-        return ErcType.by_code(self.pin_dict.get("ercType"))
+        return ErcType.by_code[self.erc_code]
 
     def __repr__(self):
         return "<icylib.ComponentPin %s>" % self.label
 
 
+def _format_spec_number(value):
+    # The shortest text that parses back to exactly the same float, so
+    # that "5.40" and "5.4" share a name but no two different dimensions
+    # do. Whole numbers lose their ".0" ("10", not "10.0").
+    text = repr(float(value))
+    if text.endswith(".0"):
+        text = text[:-2]
+    return text
+
+
+def _to_mm(quantity):
+    if quantity is None:
+        return None
+    with stats.timer("unit_conversion"):
+        return quantity.to(unit.mm).magnitude
+
+
 class Package(object):
 
+    # Packages are shared between every component that uses them (see
+    # for_spec), so they must not be modified once constructed.
+
     def __init__(self, name):
         self.name = name
+        self.canonical_name = Package.canonical_name_for(name)
         name_parts = name.split("-")
         family = name_parts[0]
 
@@ -227,45 +695,321 @@ class Package(object):
                 family, num_sides,
             ))
 
-        pads_each_side = self.pad_count / num_sides
-        self.left_pads = range(1, pads_each_side + 1)
+        pads_each_side = self.pad_count // num_sides
+        self.left_pads = tuple(range(1, pads_each_side + 1))
         if num_sides == 1:
             self.right_pads = None
             self.top_pads = None
             self.bottom_pads = None
         elif num_sides == 2:
-            self.right_pads = range(pads_each_side * 2, pads_each_side, -1)
+            self.right_pads = tuple(
+                range(pads_each_side * 2, pads_each_side, -1)
+            )
             self.top_pads = None
             self.bottom_pads = None
         elif num_sides == 4:
-            self.bottom_pads = range(
+            self.bottom_pads = tuple(range(
                 pads_each_side + 1, (pads_each_side * 2) + 1
-            )
-            self.right_pads = range(
+            ))
+            self.right_pads = tuple(range(
                 pads_each_side * 3, (pads_each_side * 2), -1,
-            )
-            self.top_pads = range(
+            ))
+            self.top_pads = tuple(range(
                 pads_each_side * 4, (pads_each_side * 3), -1,
-            )
+            ))
         else:
             raise Exception("Can't make a %i-sided package" % num_sides)
 
+        # Plain millimetre copies of the dimensions, so the exporters
+        # don't need to do any unit arithmetic.
+        self.pad_pitch_mm = _to_mm(self.pad_pitch)
+        self.pad_width_mm = _to_mm(self.pad_width)
+        self.pad_length_mm = _to_mm(self.pad_length)
+        self.hole_size_mm = _to_mm(self.hole_size)
+        self.row_spacing_mm = _to_mm(self.row_spacing)
+        self.body_width_mm = _to_mm(self.body_width)
+        self.silkscreen_overhang_mm = _to_mm(self.silkscreen_overhang)
+
+        # Holds the layout once it's first needed. This is shared with
+        # any aliases made by with_name, so it's only computed once.
+        self._layout_cache = {}
+
+        self._frozen = True
+
+    @property
+    def layout(self):
+        layout = self._layout_cache.get("layout")
+        if layout is None:
+            with stats.timer("package_layout"):
+                layout = PackageLayout(self)
+            self._layout_cache["layout"] = layout
+        return layout
+
+    @classmethod
+    def for_spec(cls, name):
+        # Returns the shared Package for the given spec. Equivalent specs
+        # (e.g. DIP-8 and DIP-8-300) share the geometry of a single
+        # canonical Package, and differ only in the name they report.
+        package = package_cache.get(name)
+        if package is not None:
+            stats.count("package_cache.hit")
+            return package
+        stats.count("package_cache.miss")
+
+        canonical_name = cls.canonical_name_for(name)
+        canonical = package_cache.peek(canonical_name)
+        if canonical is None:
+            with stats.timer("package_parse"):
+                canonical = cls(canonical_name)
+            package_cache.put(canonical_name, canonical)
+        if canonical_name == name:
+            package = canonical
+        else:
+            package = canonical.with_name(name)
+        package_cache.put(name, package)
+        return package
+
+    @staticmethod
+    def canonical_name_for(name):
+        # Fill in the defaults for any omitted parts of a package spec and
+        # normalize the numbers, so equivalent specs have the same name.
+        # Specs that don't parse are returned as-is; constructing a
+        # Package from them reports the problem.
+        name_parts = name.split("-")
+        family = name_parts[0]
+        try:
+            if family == "DIP":
+                if len(name_parts) == 2:
+                    name_parts.append("300")
+                if len(name_parts) == 3:
+                    name_parts[1] = str(int(name_parts[1]))
+                    name_parts[2] = str(int(name_parts[2]))
+            elif family == "SIP":
+                if len(name_parts) == 2:
+                    name_parts[1] = str(int(name_parts[1]))
+            elif family == "SO":
+                if len(name_parts) == 2:
+                    name_parts.append("N")
+                if len(name_parts) == 3:
+                    if name_parts[2] == "N":
+                        name_parts[2] = "5.4"
+                    elif name_parts[2] == "W":
+                        name_parts[2] = "9.3"
+                    name_parts[1] = str(int(name_parts[1]))
+                    name_parts[2] = _format_spec_number(name_parts[2])
+            elif family in ("QFP", "TQFP", "LQFP"):
+                if len(name_parts) == 3:
+                    name_parts.append("0.8")
+                    name_parts.append("0.55")
+                if len(name_parts) == 5:
+                    name_parts[1] = str(int(name_parts[1]))
+                    for i in (2, 3, 4):
+                        name_parts[i] = _format_spec_number(name_parts[i])
+        except ValueError:
+            return name
+        return "-".join(name_parts)
+
+    def with_name(self, name):
+        # A copy of this package that shares all of its geometry but
+        # reports a different (equivalent) spec as its name.
+        package = object.__new__(Package)
+        package.__dict__.update(self.__dict__)
+        package.__dict__["name"] = name
+        return package
+
+    def __setattr__(self, name, value):
+        if self.__dict__.get("_frozen"):
+            raise AttributeError("Package objects are immutable")
+        object.__setattr__(self, name, value)
+
+    def __eq__(self, other):
+        if not isinstance(other, Package):
+            return NotImplemented
+        return self.canonical_name == other.canonical_name
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __hash__(self):
+        return hash(self.canonical_name)
+
+    def __repr__(self):
+        return "<icylib.Package %s>" % self.name
+
+
+class PackageLayout(object):
+    # The footprint geometry of a package in millimetres: the position of
+    # every pad, and the silkscreen outline. This is worked out once per
+    # package, so the exporters only need to format the results.
+
+    def __init__(self, package):
+        pitch = package.pad_pitch
+
+        # Each pad set is (pad numbers, start position, step, angle).
+        pad_sets = []
+        left_start = [
+            0.0 * unit.mm,
+            ((len(package.left_pads) - 1) * pitch) / -2,
+        ]
+        pad_sets.append(
+            (package.left_pads, left_start, (0.0 * unit.mm, pitch), 0.0)
+        )
+        if package.right_pads is not None:
+            # Shift the left pads leftwards to center on the middle of the
+            # package.
+            left_start[0] = package.row_spacing / -2
+            pad_sets.append((
+                package.right_pads,
+                (package.row_spacing / 2.0, left_start[1]),
+                (0.0 * unit.mm, pitch),
+                0.0,
+            ))
+        if package.top_pads is not None:
+            pad_sets.append((
+                package.top_pads,
+                (
+                    ((len(package.top_pads) - 1) * pitch) / -2,
+                    package.row_spacing / -2.0,
+                ),
+                (pitch, 0.0 * unit.mm),
+                90.0,
+            ))
+        if package.bottom_pads is not None:
+            pad_sets.append((
+                package.bottom_pads,
+                (
+                    ((len(package.bottom_pads) - 1) * pitch) / -2,
+                    package.row_spacing / 2.0,
+                ),
+                (pitch, 0.0 * unit.mm),
+                90.0,
+            ))
+
+        # List of (pad number, x, y, angle) for every pad in the package.
+        self.pads = _layout_pads(pad_sets)
+
+        silkscreen_height = (
+            ((len(package.left_pads) - 1) * pitch) +
+            (package.silkscreen_overhang * 2.0)
+        )
+        silkscreen_width = package.silkscreen_overhang * 2
+        if package.right_pads is not None:
+            silkscreen_width = package.body_width
+        if package.top_pads is not None:
+            silkscreen_height = package.body_width
+        self.silkscreen_height = _to_mm(silkscreen_height)
+        self.silkscreen_width = _to_mm(silkscreen_width)
+
+        # The pin 1 marker is a circle given as (center x, center y,
+        # edge x), or None if the package doesn't have one.
+        self.pin_1_marker = None
+        if package.pin_1_marker:
+            marker_x = (silkscreen_width / -2.0) + pitch
+            marker_y = (silkscreen_height / -2.0) + pitch
+            self.pin_1_marker = (
+                _to_mm(marker_x),
+                _to_mm(marker_y),
+                _to_mm(marker_x + (package.pad_width / 2)),
+            )
+
+
+def _layout_pads(pad_sets):
+    # Position all of the pads of all of the pad sets in one go, using
+    # numpy if it's available.
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+
+    pads = []
+    for pad_nums, start, step, angle in pad_sets:
+        xs = _layout_axis(start[0], step[0], len(pad_nums), numpy)
+        ys = _layout_axis(start[1], step[1], len(pad_nums), numpy)
+        pads.extend(zip(pad_nums, xs, ys, [angle] * len(pad_nums)))
+    return pads
+
+
+def _layout_axis(start, step, count, numpy):
+    # Positions (in mm) along one axis of a row of pads. Each position is
+    # the previous one plus the step, worked out in the start position's
+    # units and only then converted, exactly as stepping a pint quantity
+    # along would do. This keeps the rounding (down to the sign of any
+    # zeros) identical to what the exporters have always produced.
+    start_value = start.magnitude
+    step_value = step.to(start.units).magnitude
+    factor = _to_mm(1.0 * start.units)
+    if count == 0:
+        return []
+    if numpy is None:
+        values = [start_value]
+        for i in range(1, count):
+            values.append(values[-1] + step_value)
+        return [value * factor for value in values]
+    values = numpy.empty(count)
+    values[0] = start_value
+    values[1:] = step_value
+    return (numpy.add.accumulate(values) * factor).tolist()
+
 
 class PackageMapping(object):
 
+    __slots__ = (
+        "component",
+        "package",
+        "pin_mapping",
+        "pad_numbers",
+        "_pins_by_pad",
+    )
+
     def __init__(self, component, package, mapping_dict):
+        import array
         self.component = component
         self.package = package
-        self.pin_mapping = mapping_dict.get("pads", [])
-        self.pad_mapping = {
+        self.pin_mapping = tuple(mapping_dict.get("pads", []))
+
+        # The pad number for each of the component's pins, by pin index,
+        # with 0 for pins the package doesn't have. If a label appears
+        # on several pads, its pins go to the last of them.
+        pad_mapping = self.pad_mapping
+        self.pad_numbers = array.array("H", [
+            pad_mapping.get(pin.label, 0)
+            for pin in component.pin_groups.pins
+        ])
+        self._pins_by_pad = None
+
+    @property
+    def pins_by_pad(self):
+        # The component's pin on each pad number, for pads that have one.
+        if self._pins_by_pad is None:
+            pins_by_label = self.component.pins_by_label
+            pins_by_pad = {}
+            for i, label in enumerate(self.pin_mapping):
+                pin = pins_by_label.get(label)
+                if pin is not None:
+                    pins_by_pad[i + 1] = pin
+            self._pins_by_pad = pins_by_pad
+        return self._pins_by_pad
+
+    def pin_for_pad(self, pad_number):
+        return self.pins_by_pad.get(pad_number)
+
+    @property
+    def pad_mapping(self):
+        return {
             label: i + 1 for i, label in enumerate(self.pin_mapping)
         }
 
     def has_pin(self, pin):
-        return pin.label in self.pad_mapping
+        return self.pad_numbers[pin.index] != 0
 
     def pad_number_for_pin(self, pin):
-        return self.pad_mapping[pin.label]
+        pad_number = self.pad_numbers[pin.index]
+        if pad_number == 0:
+            raise KeyError(pin.label)
+        return pad_number
 
     def __repr__(self):
         return "<icylib.PackageMapping %s %r>" % (
@@ -0,0 +1,126 @@
+
+import bisect
+
+from icylib.model import ErcType, Package
+
+
+class SearchIndex(object):
+    # In-memory lookup tables over a set of components: by manufacturer
+    # and name, by package spec or family, by pin label or ERC type, and
+    # by name prefix. Components are identified by (manufacturer code,
+    # name), and adding a component with the same key as an existing one
+    # replaces it, so the index can be kept up to date as components
+    # change.
+
+    def __init__(self, components=()):
+        self.components = {}
+        self.by_package_spec = {}
+        self.by_package_family = {}
+        self.by_pin_label = {}
+        self.by_erc_code = {}
+        # Sorted list of (name, manufacturer code), for prefix searches.
+        self.names = []
+        # The tables each component is filed in, with the set of terms it's
+        # filed under in each, so it can be removed again.
+        self._terms = {}
+
+        for component in components:
+            self.add(component)
+
+    @classmethod
+    def for_library(cls, library):
+        return cls(library.components)
+
+    @staticmethod
+    def key_for(component):
+        return (component.manufacturer.code, component.name)
+
+    def add(self, component):
+        key = self.key_for(component)
+        if key in self.components:
+            self.remove(key)
+        self._add(component)
+
+    def remove(self, key):
+        # Accepts either a component or a (manufacturer code, name) key.
+        if not isinstance(key, tuple):
+            key = self.key_for(key)
+        if key not in self.components:
+            return
+        del self.components[key]
+        for table, terms in self._terms.pop(key):
+            for term in terms:
+                keys = table[term]
+                keys.discard(key)
+                if len(keys) == 0:
+                    del table[term]
+        i = bisect.bisect_left(self.names, (key[1], key[0]))
+        del self.names[i]
+
+    def _add(self, component):
+        key = self.key_for(component)
+        self.components[key] = component
+        # Sets, since a component can have several packages in a family
+        # and several pins with the same label or ERC type.
+        specs = component.package_specs
+        pins = component.pin_groups.pins
+        terms = [
+            (
+                self.by_package_spec,
+                set(Package.canonical_name_for(spec) for spec in specs),
+            ),
+            (
+                self.by_package_family,
+                set(spec.split("-")[0] for spec in specs),
+            ),
+            (self.by_pin_label, set(pin.label for pin in pins)),
+            (self.by_erc_code, set(pin.erc_code for pin in pins)),
+        ]
+        for table, table_terms in terms:
+            for term in table_terms:
+                table.setdefault(term, set()).add(key)
+        self._terms[key] = terms
+        if len(self.names) == 0 or self.names[-1] < (key[1], key[0]):
+            # Still building the index in order; no need to sort.
+            self.names.append((key[1], key[0]))
+        else:
+            bisect.insort(self.names, (key[1], key[0]))
+
+    def get(self, manufacturer_code, name):
+        return self.components.get((manufacturer_code, name))
+
+    def _lookup(self, table, term):
+        keys = sorted(table.get(term, ()))
+        return [self.components[key] for key in keys]
+
+    def with_package(self, spec):
+        # Matches equivalent specs too, e.g. "SO-14" finds "SO-14-N".
+        return self._lookup(
+            self.by_package_spec, Package.canonical_name_for(spec),
+        )
+
+    def with_package_family(self, family):
+        return self._lookup(self.by_package_family, family)
+
+    def with_pin_label(self, label):
+        return self._lookup(self.by_pin_label, label)
+
+    def with_erc_type(self, erc_type):
+        if isinstance(erc_type, ErcType):
+            erc_type = erc_type.code
+        return self._lookup(self.by_erc_code, erc_type)
+
+    def with_name_prefix(self, prefix):
+        results = []
+        i = bisect.bisect_left(self.names, (prefix,))
+        while i < len(self.names) and self.names[i][0].startswith(prefix):
+            name, code = self.names[i]
+            results.append(self.components[(code, name)])
+            i += 1
+        return results
+
+    def __len__(self):
+        return len(self.components)
+
+    def __contains__(self, key):
+        return key in self.components
@@ -0,0 +1,253 @@
+
+import hashlib
+import sys
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import unquote
+    from urlparse import urlparse
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import unquote, urlparse
+
+from icylib.exporter import kicad
+from icylib.util import LRUCache
+
+
+# Serves freshly exported KiCad files from a library over HTTP:
+#
+#   /symbols.lib                    the symbol library for every component
+#   /symbols/CODE.lib               ... for one manufacturer's components
+#   /symbols/CODE/NAME.lib          ... for a single component
+#   /docs.dcm, /docs/CODE.dcm, /docs/CODE/NAME.dcm
+#                                   the matching doc libraries
+#   /footprints/SPEC.kicad_mod      the footprint for a package spec
+#
+# Rendered responses are cached by a hash of everything they're made from
+# (the components' source JSON, byte for byte, and the exporter version),
+# which is also sent as the ETag, so clients can revalidate with
+# If-None-Match. The library is read afresh for every request, so edits
+# show up straight away; give it a component cache (see Library) to avoid
+# decoding unchanged files.
+#
+#   python -m icylib.server LIBRARY_DIR [--host HOST] [--port PORT]
+
+CONTENT_TYPE = "text/plain; charset=utf-8"
+
+
+class ExportServer(object):
+
+    def __init__(
+        self, library, host="127.0.0.1", port=8000,
+        cache_bytes=64 * 1024 * 1024,
+    ):
+        self.library = library
+        self.host = host
+        self.port = port
+        self.responses = LRUCache(
+            maxsize=None, maxbytes=cache_bytes, sizeof=len,
+        )
+        # Keys of the responses being rendered, each with an event that's
+        # set once it's done, so concurrent requests for the same response
+        # wait for it rather than rendering it again.
+        self.rendering = {}
+        self.lock = threading.Lock()
+        self.http_server = None
+
+    def serve_forever(self):
+        self.http_server = _HTTPServer((self.host, self.port), _RequestHandler)
+        self.http_server.export_server = self
+        self.http_server.serve_forever()
+
+    def shutdown(self):
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+
+    def resolve(self, path):
+        # Returns (cache key, render function) for a request path, or None
+        # if there's nothing there.
+        parts = path.strip("/").split("/")
+        if len(parts) == 2 and parts[0] == "footprints":
+            return self._resolve_footprint(parts[1])
+        kinds = {"symbols": ".lib", "docs": ".dcm"}
+        kind, extension = None, None
+        for kind_name in kinds:
+            if parts[0] in (kind_name, kind_name + kinds[kind_name]):
+                kind, extension = kind_name, kinds[kind_name]
+        if kind is None or len(parts) > 3:
+            return None
+        if len(parts) == 1:
+            if parts[0] != kind + extension:
+                return None
+            components = list(self.library.components)
+        else:
+            if not parts[-1].endswith(extension):
+                return None
+            parts[-1] = parts[-1][:-len(extension)]
+            components = self._components(*parts[1:])
+            if components is None:
+                return None
+        return self._resolve_components(kind, components)
+
+    def _components(self, manufacturer_code, name=None):
+        if name is not None:
+            component = self.library.component(manufacturer_code, name)
+            return [component] if component is not None else None
+        for manufacturer in self.library.component_manufacturers:
+            if manufacturer.code == manufacturer_code:
+                return list(manufacturer.components)
+        return None
+
+    def _resolve_components(self, kind, components):
+        digest = hashlib.sha1()
+        digest.update(
+            ("%s:%i\n" % (kind, kicad.EXPORTER_VERSION)).encode("utf-8")
+        )
+        # content_hash is a digest of each component's source bytes, so
+        # an edit that only reorders its keys (and with them the order of
+        # its symbols) changes the key too.
+        for component in components:
+            digest.update((u"%s/%s:%s\n" % (
+                component.manufacturer.code,
+                component.name,
+                component.content_hash,
+            )).encode("utf-8"))
+        if kind == "symbols":
+            render = kicad.iter_eeschema_library
+        else:
+            render = kicad.iter_eeschema_doclib
+        return digest.hexdigest(), lambda: _join(render(components))
+
+    def _resolve_footprint(self, filename):
+        from icylib.model import Package
+        extension = ".kicad_mod"
+        if not filename.endswith(extension):
+            return None
+        spec = filename[:-len(extension)]
+        try:
+            package = Package.for_spec(spec)
+        except Exception:
+            return None
+        # A footprint depends only on its package spec.
+        key = hashlib.sha1((u"footprints:%i\n%s" % (
+            kicad.EXPORTER_VERSION, spec,
+        )).encode("utf-8")).hexdigest()
+        return key, lambda: _join(kicad.iter_pcbnew_module(package))
+
+    def response(self, key, render):
+        # Returns the body for the given key, rendering it only if it isn't
+        # cached and no other request is already rendering it.
+        body = self.responses.get(key)
+        while body is None:
+            with self.lock:
+                body = self.responses.peek(key)
+                if body is not None:
+                    break
+                event = self.rendering.get(key)
+                rendering = event is None
+                if rendering:
+                    event = threading.Event()
+                    self.rendering[key] = event
+            if not rendering:
+                # Wait for the other request's result. If it failed, or the
+                # response was evicted already, go round and render it.
+                event.wait()
+                body = self.responses.peek(key)
+                continue
+            try:
+                body = render()
+                self.responses.put(key, body)
+            finally:
+                with self.lock:
+                    del self.rendering[key]
+                event.set()
+        return body
+
+
+def _join(texts):
+    return u"".join(texts).encode("utf-8")
+
+
+class _HTTPServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+    export_server = None
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        export_server = self.server.export_server
+        path = unquote(urlparse(self.path).path)
+        try:
+            route = export_server.resolve(path)
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        if route is None:
+            self.send_error(404)
+            return
+        key, render = route
+
+        etag = '"%s"' % key
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            if etag in tags or "*" in tags:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+        try:
+            body = export_server.response(key, render)
+        except Exception as e:
+            self.send_error(500, str(e))
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+
+def main(argv=None):
+    import argparse
+    from icylib.model import Library
+
+    parser = argparse.ArgumentParser(prog="python -m icylib.server")
+    parser.add_argument("library_dir")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--component-cache-size", type=int, default=100000)
+    args = parser.parse_args(argv)
+
+    library = Library(
+        args.library_dir, cache_size=args.component_cache_size,
+    )
+    server = ExportServer(library, host=args.host, port=args.port)
+    sys.stderr.write("Serving %s on http://%s:%i/\n" % (
+        args.library_dir, args.host, args.port,
+    ))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+
+# Opt-in instrumentation. Once a Stats collector is enabled, icylib
+# records how many times each phase of its work ran and how long it took
+# in total (listing directories, decoding JSON, parsing packages, writing
+# output, ...), along with cache hit and miss counts. Phases can nest
+# (e.g. "write" happens inside "export_eeschema_library"), so their
+# durations don't add up to the total time.
+#
+# While no collector is enabled, a timed phase costs a call to timer(),
+# which hands back a shared no-op context manager, and a counter costs a
+# check of the module-level collector.
+#
+# Work done by the process executor happens in other interpreters and
+# isn't recorded; the thread executor's is.
+#
+#   stats = icylib.stats.enable()
+#   ... do some work ...
+#   icylib.stats.disable()
+#   print(stats.as_dict())
+
+import contextlib
+import threading
+import time
+
+
+# The enabled Stats collector, or None.
+collector = None
+
+
+class Stats(object):
+
+    def __init__(self, callback=None):
+        # If given, callback(name, count, duration) is called for every
+        # event as it's recorded, e.g. to forward them to a metrics
+        # system. duration is None for plain counters.
+        self.callback = callback
+        self.counts = {}
+        self.durations = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, duration=None, count=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + count
+            if duration is not None:
+                self.durations[name] = self.durations.get(name, 0.0) + duration
+        if self.callback is not None:
+            self.callback(name, count, duration)
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+            self.durations = {}
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                name: {
+                    "count": count,
+                    "duration": self.durations.get(name),
+                }
+                for name, count in self.counts.items()
+            }
+
+
+def enable(stats=None, callback=None):
+    global collector
+    if stats is None:
+        stats = Stats(callback=callback)
+    collector = stats
+    return stats
+
+
+def disable():
+    global collector
+    collector = None
+
+
+@contextlib.contextmanager
+def collecting(callback=None):
+    # Enables a new collector for the duration of a with block, restoring
+    # whatever was enabled before.
+    global collector
+    previous = collector
+    stats = enable(callback=callback)
+    try:
+        yield stats
+    finally:
+        collector = previous
+
+
+class _Timer(object):
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats.record(self.name, time.time() - self.start)
+        return False
+
+
+class _NullTimer(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+def timer(name):
+    # Use as "with stats.timer(name):" to time a phase.
+    stats = collector
+    if stats is None:
+        return _null_timer
+    return _Timer(stats, name)
+
+
+def count(name, count=1):
+    stats = collector
+    if stats is not None:
+        stats.record(name, count=count)
@@ -0,0 +1,150 @@
+
+import collections
+import contextlib
+import os
+import os.path
+import sys
+import threading
+
+
+@contextlib.contextmanager
+def atomic_open(path, mode='w'):
+    # Write to a temporary file alongside the target and only move it
+    # into place once the caller has finished writing, so readers never
+    # observe a partially-written file.
+    tmp_path = "%s.%i-%i.tmp" % (
+        path,
+        os.getpid(),
+        threading.current_thread().ident,
+    )
+    try:
+        with open(tmp_path, mode) as f:
+            yield f
+        if os.name == "nt" and os.path.exists(path):
+            # os.rename won't overwrite an existing file on Windows.
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def make_pool(workers, executor="thread"):
+    # A multiprocessing pool of the given kind: "thread" for I/O-bound
+    # work, or "process" to spread CPU-bound work over several cores.
+    if executor == "process":
+        from multiprocessing import Pool
+    elif executor == "thread":
+        from multiprocessing.pool import ThreadPool as Pool
+    else:
+        raise Exception("Unsupported executor '%s'" % executor)
+    return Pool(workers)
+
+
+class LRUCache(object):
+    # A small thread-safe mapping that holds at most maxsize entries,
+    # discarding the least recently used entry to make room for new ones.
+    #
+    # It can also (or instead, with maxsize=None) be bounded by the total
+    # size of its entries, with maxbytes. Each entry's size is given when
+    # it's put, or else worked out by sizeof.
+
+    def __init__(self, maxsize=1024, maxbytes=None, sizeof=sys.getsizeof):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.sizeof = sizeof
+        self.entries = collections.OrderedDict()
+        self.sizes = {}
+        self.total_size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None, valid=None):
+        # If valid is given, an entry for which valid(value) is false is
+        # discarded, and counted as a miss.
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if valid is not None and not valid(value):
+                self._discard(key)
+                self.invalidations += 1
+                self.misses += 1
+                return default
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        # Like get, but without counting towards the hit/miss stats.
+        with self.lock:
+            try:
+                value = self.entries.pop(key)
+            except KeyError:
+                return default
+            self.entries[key] = value
+            return value
+
+    def put(self, key, value, size=None):
+        with self.lock:
+            if key in self.entries:
+                del self.entries[key]
+                self._discard(key)
+            self.entries[key] = value
+            if self.maxbytes is not None:
+                if size is None:
+                    size = self.sizeof(value)
+                self.sizes[key] = size
+                self.total_size += size
+            while (
+                (self.maxsize is not None and len(self.entries) > self.maxsize) or
+                (self.maxbytes is not None and self.total_size > self.maxbytes)
+            ):
+                old_key, old_value = self.entries.popitem(last=False)
+                self._discard(old_key)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self.lock:
+            value = self.entries.pop(key, default)
+            self._discard(key)
+            return value
+
+    def _discard(self, key):
+        # Forgets the size of an entry that's been taken out of entries.
+        self.total_size -= self.sizes.pop(key, 0)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.total_size = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.invalidations = 0
+
+    @property
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "bytes": self.total_size,
+            "maxbytes": self.maxbytes,
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
@@ -0,0 +1,207 @@
+
+import json
+import sys
+
+from icylib.model import ErcType, Package, load_component_file
+from icylib.util import make_pool
+
+
+ERROR = "error"
+WARNING = "warning"
+
+PIN_CATEGORY_NAMES = ("topPower", "bottomPower", "left", "right")
+
+
+class ValidationReport(object):
+    # The problems found in a library. Each issue is a dict with the
+    # manufacturer code and component name it concerns, the rule that
+    # found it, its severity ("error" or "warning"), where in the
+    # component's JSON the problem is, and a human-readable message.
+
+    def __init__(self, issues=None, component_count=0):
+        self.issues = issues if issues is not None else []
+        self.component_count = component_count
+
+    @property
+    def errors(self):
+        return [issue for issue in self.issues if issue["severity"] == ERROR]
+
+    @property
+    def warnings(self):
+        return [
+            issue for issue in self.issues if issue["severity"] == WARNING
+        ]
+
+    @property
+    def ok(self):
+        return len(self.errors) == 0
+
+    def as_dict(self):
+        return {
+            "components": self.component_count,
+            "errors": len(self.errors),
+            "warnings": len(self.warnings),
+            "issues": self.issues,
+        }
+
+    def write_json(self, out_file):
+        json.dump(self.as_dict(), out_file, indent=2, sort_keys=True)
+
+
+def validate_library(library, workers=None, executor="process", chunk_size=64):
+    # Checks every component file in the library, spreading the files
+    # over a pool of workers if requested. The issues are reported in
+    # directory order either way. For a compiled library its records are
+    # checked instead, and the jobs carry the records themselves.
+    jobs = []
+    compiled = library.compiled
+    for manufacturer in library.component_manufacturers:
+        if compiled is not None:
+            for name, record in compiled.component_records(manufacturer):
+                jobs.append((
+                    manufacturer.code, name, None, compiled.record(record),
+                ))
+            continue
+        for name, path in manufacturer.component_files:
+            jobs.append((manufacturer.code, name, path, None))
+
+    if workers is None:
+        results = [_validate_component_job(job) for job in jobs]
+    else:
+        pool = make_pool(workers, executor)
+        try:
+            results = pool.map(_validate_component_job, jobs, chunk_size)
+        finally:
+            pool.terminate()
+
+    issues = []
+    for component_issues in results:
+        issues.extend(component_issues)
+    return ValidationReport(issues, len(jobs))
+
+
+def _validate_component_job(job):
+    manufacturer_code, name, path, record = job
+    try:
+        if record is None:
+            json_dict = load_component_file(path)
+        else:
+            json_dict = json.loads(record.decode("utf-8"))
+    except (IOError, OSError, ValueError) as e:
+        return [_issue(
+            manufacturer_code, name, "invalid-json", ERROR, "", str(e),
+        )]
+    try:
+        return validate_component_dict(manufacturer_code, name, json_dict)
+    except (AttributeError, TypeError) as e:
+        # Something that should be a list or object isn't.
+        return [_issue(
+            manufacturer_code, name, "invalid-structure", ERROR, "", str(e),
+        )]
+
+
+def validate_component_dict(manufacturer_code, name, json_dict):
+    # Checks a single component's decoded JSON, returning a list of
+    # issue dicts (see ValidationReport).
+    issues = []
+
+    def report(rule, severity, location, message):
+        issues.append(_issue(
+            manufacturer_code, name, rule, severity, location, message,
+        ))
+
+    if not isinstance(json_dict, dict):
+        report("invalid-json", ERROR, "", "component must be a JSON object")
+        return issues
+
+    pins_dict = json_dict.get("pins", {})
+    labels = set()
+    for category_name in PIN_CATEGORY_NAMES:
+        for i, pin_group in enumerate(pins_dict.get(category_name, [])):
+            for j, pin_dict in enumerate(pin_group):
+                location = "pins.%s[%i][%i]" % (category_name, i, j)
+                label = pin_dict.get("label")
+                if label is None:
+                    report(
+                        "missing-pin-label", ERROR, location,
+                        "pin has no label",
+                    )
+                elif label in labels:
+                    report(
+                        "duplicate-pin-label", ERROR, location,
+                        "pin label '%s' is used more than once" % label,
+                    )
+                labels.add(label)
+                erc_code = pin_dict.get("ercType")
+                if erc_code not in ErcType.by_code:
+                    report(
+                        "unknown-erc-type", ERROR, location,
+                        "unknown ercType '%s'" % erc_code,
+                    )
+
+    packages_dict = json_dict.get("packages", {})
+    for spec in sorted(packages_dict):
+        location = "packages.%s" % spec
+        try:
+            package = Package.for_spec(spec)
+        except Exception as e:
+            report("invalid-package", ERROR, location, str(e))
+            package = None
+
+        pads = packages_dict[spec].get("pads", [])
+        if package is not None and len(pads) > package.pad_count:
+            report(
+                "pad-count", ERROR, location + ".pads",
+                "%i pads listed but %s only has %i" % (
+                    len(pads), spec, package.pad_count,
+                ),
+            )
+        elif package is not None and len(pads) < package.pad_count:
+            report(
+                "pad-count", WARNING, location + ".pads",
+                "%i pads listed but %s has %i" % (
+                    len(pads), spec, package.pad_count,
+                ),
+            )
+        for i, label in enumerate(pads):
+            if label != "" and label not in labels:
+                report(
+                    "unknown-pad-label", WARNING,
+                    "%s.pads[%i]" % (location, i),
+                    "pad label '%s' doesn't match any pin" % label,
+                )
+
+    return issues
+
+
+def _issue(manufacturer_code, name, rule, severity, location, message):
+    return {
+        "manufacturer": manufacturer_code,
+        "component": name,
+        "rule": rule,
+        "severity": severity,
+        "location": location,
+        "message": message,
+    }
+
+
+def main(argv=None):
+    # python -m icylib.validate LIBRARY_DIR [--workers N]
+    # Prints the report as JSON and exits non-zero if there are errors,
+    # so it can be used as a pre-commit check.
+    import argparse
+    from icylib.model import Library
+
+    parser = argparse.ArgumentParser(prog="python -m icylib.validate")
+    parser.add_argument("library_dir")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    report = validate_library(Library(args.library_dir), workers=args.workers)
+    report.write_json(sys.stdout)
+    sys.stdout.write("\n")
+    return 0 if report.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
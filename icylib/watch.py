@@ -0,0 +1,377 @@
+
+import os
+import os.path
+import select
+import struct
+import sys
+import threading
+
+from icylib.model import Component, Manufacturer, load_component_file
+
+
+class LibraryChanges(object):
+    # What changed in a library between two updates of a LibraryWatcher.
+    # added and changed hold the new components, removed the components
+    # as they were before their files went away, and errors a list of
+    # ((manufacturer code, name), exception) for any files that couldn't
+    # be decoded or aren't valid components (e.g. because they were
+    # caught half-written; they'll be picked up again when they next
+    # change).
+
+    def __init__(self):
+        self.added = []
+        self.changed = []
+        self.removed = []
+        self.errors = []
+        # Every package spec used by the affected components, before or
+        # after the change.
+        self.package_names = set()
+
+    def __len__(self):
+        return (
+            len(self.added) + len(self.changed) + len(self.removed) +
+            len(self.errors)
+        )
+
+    def __repr__(self):
+        return "<icylib.LibraryChanges +%i ~%i -%i !%i>" % (
+            len(self.added),
+            len(self.changed),
+            len(self.removed),
+            len(self.errors),
+        )
+
+
+class LibraryWatcher(object):
+    # Keeps an in-memory copy of a library's components up to date as
+    # their files are added, changed and removed, calling callback(changes)
+    # with a LibraryChanges after each update so that only the affected
+    # symbols and footprints need to be exported again.
+    #
+    # On Linux the components directory is watched with inotify; elsewhere
+    # (or with use_inotify=False) it's polled every interval seconds.
+    # Either way, an update only happens once the files have stopped
+    # changing for debounce seconds, so a burst of edits (or an editor
+    # writing a file in several steps) is reported once.
+    #
+    # The callback is called from the watcher's thread.
+
+    def __init__(
+        self, library, callback=None, interval=1.0, debounce=0.25,
+        use_inotify=None,
+    ):
+        if library.compiled is not None:
+            raise Exception("Can't watch a compiled library")
+        if use_inotify is None:
+            use_inotify = sys.platform.startswith("linux")
+        self.library = library
+        self.callback = callback
+        self.interval = interval
+        self.debounce = debounce
+        self.use_inotify = use_inotify
+        # (manufacturer code, name) -> (mtime, size, path, component,
+        # package specs) for every component file seen.
+        self.entries = {}
+        self.manufacturers = {}
+        self.lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._inotify = None
+
+    @property
+    def components(self):
+        with self.lock:
+            entries = sorted(self.entries.items())
+        for key, entry in entries:
+            if entry[3] is not None:
+                yield entry[3]
+
+    def component(self, manufacturer_code, name):
+        with self.lock:
+            entry = self.entries.get((manufacturer_code, name))
+        return entry[3] if entry is not None else None
+
+    def start(self):
+        # Loads the library and starts watching it in a background thread.
+        if self.use_inotify:
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError):
+                # No inotify here after all (AttributeError if libc doesn't
+                # have the functions).
+                self._inotify = None
+        if self._inotify is not None:
+            # Start watching before the first scan so nothing that changes
+            # in between is missed.
+            self._inotify.add_watch(self.library.components_dir, None)
+            for code in self._manufacturer_codes():
+                self._inotify.add_watch(
+                    os.path.join(self.library.components_dir, code), code,
+                )
+        self._update(self._scan(), None, notify=False)
+
+        self._stopping.clear()
+        if self._inotify is not None:
+            target = self._run_inotify
+        else:
+            target = self._run_polling
+        self._thread = threading.Thread(target=target)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def poll(self):
+        # Checks every file for changes right away, updating and notifying
+        # as usual. Returns the LibraryChanges. This can be used without
+        # starting the watcher at all, to check for changes on demand.
+        return self._update(self._scan(), None)
+
+    def _manufacturer_codes(self):
+        components_dir = self.library.components_dir
+        try:
+            codes = os.listdir(components_dir)
+        except OSError:
+            return []
+        return [
+            code for code in codes
+            if os.path.isdir(os.path.join(components_dir, code))
+        ]
+
+    def _scan(self, codes=None):
+        # Returns {(manufacturer code, name): (mtime, size, path)} for the
+        # component files of the given manufacturers, or of all of them.
+        if codes is None:
+            codes = self._manufacturer_codes()
+        state = {}
+        for code in codes:
+            manufacturer_dir = os.path.join(self.library.components_dir, code)
+            try:
+                filenames = os.listdir(manufacturer_dir)
+            except OSError:
+                # The whole manufacturer was removed.
+                continue
+            for filename in filenames:
+                if filename[-5:] != ".json":
+                    continue
+                path = os.path.join(manufacturer_dir, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                state[(code, filename[:-5])] = (
+                    stat.st_mtime, stat.st_size, path,
+                )
+        return state
+
+    def _current_state(self):
+        with self.lock:
+            return dict(
+                (key, entry[:3]) for key, entry in self.entries.items()
+            )
+
+    def _update(self, state, codes, notify=True):
+        # Brings the entries for the given manufacturers (or all of them)
+        # in line with a scan of their files.
+        changes = LibraryChanges()
+        with self.lock:
+            entries = dict(self.entries)
+        for key, entry in list(entries.items()):
+            if codes is not None and key[0] not in codes:
+                continue
+            if key not in state:
+                del entries[key]
+                if entry[3] is not None:
+                    changes.removed.append(entry[3])
+                    changes.package_names.update(entry[4])
+
+        for key in sorted(state):
+            mtime, size, path = state[key]
+            old_entry = entries.get(key)
+            if old_entry is not None and old_entry[:2] == (mtime, size):
+                continue
+            code, name = key
+            manufacturer = self.manufacturers.get(code)
+            if manufacturer is None:
+                manufacturer = Manufacturer(
+                    self.library, code,
+                    os.path.join(self.library.components_dir, code),
+                )
+                self.manufacturers[code] = manufacturer
+            try:
+                if self.library.lazy:
+                    component = Component(manufacturer, name, path=path)
+                else:
+                    component = Component(
+                        manufacturer, name, load_component_file(path),
+                        path=path,
+                    )
+                package_specs = component.package_specs
+            except Exception as e:
+                # Anything from an unreadable file to JSON that isn't
+                # shaped like a component; one bad file mustn't stop the
+                # others (or the watcher's thread).
+                changes.errors.append((key, e))
+                component = None
+                package_specs = ()
+            entries[key] = (mtime, size, path, component, package_specs)
+            changes.package_names.update(package_specs)
+            if old_entry is not None and old_entry[3] is not None:
+                changes.package_names.update(old_entry[4])
+                if component is not None:
+                    changes.changed.append(component)
+                else:
+                    changes.removed.append(old_entry[3])
+            elif component is not None:
+                changes.added.append(component)
+
+        with self.lock:
+            self.entries = entries
+        if len(changes) > 0 and self.library.index is not None:
+            self.library.index.refresh()
+        if notify and len(changes) > 0 and self.callback is not None:
+            self.callback(changes)
+        return changes
+
+    def _update_from_thread(self, state, codes):
+        # _update for the watcher's thread, which reports errors (from the
+        # callback, say) rather than dying of them, so watching carries on.
+        try:
+            self._update(state, codes)
+        except Exception:
+            import traceback
+            traceback.print_exc()
+
+    def _run_polling(self):
+        # The state seen by the previous poll, if it differed from the
+        # entries; it's only applied once a poll finds it unchanged.
+        pending = None
+        while True:
+            wait = self.interval if pending is None else self.debounce
+            self._stopping.wait(wait)
+            if self._stopping.is_set():
+                return
+            state = self._scan()
+            if state == self._current_state():
+                pending = None
+            elif state != pending:
+                pending = state
+            else:
+                self._update_from_thread(state, None)
+                pending = None
+
+    def _run_inotify(self):
+        inotify = self._inotify
+        # Codes of the manufacturers with changes. If the kernel's event
+        # queue overflowed, everything needs checking.
+        dirty = set()
+        overflowed = False
+        while not self._stopping.is_set():
+            pending = overflowed or len(dirty) > 0
+            timeout = self.debounce if pending else self.interval
+            readable, _, _ = select.select([inotify.fd], [], [], timeout)
+            if len(readable) > 0:
+                for code, mask, name in inotify.read_events():
+                    if mask & _Inotify.IN_Q_OVERFLOW:
+                        overflowed = True
+                        continue
+                    if code is None:
+                        # Something happened to a manufacturer directory.
+                        code = name
+                        if mask & _Inotify.IN_ISDIR and mask & (
+                            _Inotify.IN_CREATE | _Inotify.IN_MOVED_TO
+                        ):
+                            inotify.add_watch(os.path.join(
+                                self.library.components_dir, code,
+                            ), code)
+                    dirty.add(code)
+                continue
+            if overflowed:
+                self._update_from_thread(self._scan(), None)
+            elif len(dirty) > 0:
+                self._update_from_thread(self._scan(dirty), dirty)
+            dirty = set()
+            overflowed = False
+
+
+class _Inotify(object):
+    # Just enough of the Linux inotify API, through ctypes.
+
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0x80000
+
+    watch_mask = (
+        IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+        IN_CREATE | IN_DELETE
+    )
+
+    event_header = struct.Struct("iIII")
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True,
+        )
+        self.fd = self.libc.inotify_init1(self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch descriptor -> manufacturer code (None for the components
+        # directory itself).
+        self.codes = {}
+
+    def add_watch(self, path, code):
+        wd = self.libc.inotify_add_watch(
+            self.fd, path.encode(sys.getfilesystemencoding()),
+            self.watch_mask,
+        )
+        if wd < 0:
+            # The directory may have gone again already; it'll be picked up
+            # by the next scan anyway.
+            return
+        self.codes[wd] = code
+
+    def read_events(self):
+        # Returns (manufacturer code, mask, name) for each pending event,
+        # where code is None for events in the components directory.
+        data = os.read(self.fd, 64 * 1024)
+        events = []
+        offset = 0
+        while offset + self.event_header.size <= len(data):
+            wd, mask, cookie, length = self.event_header.unpack_from(
+                data, offset,
+            )
+            offset += self.event_header.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            name = name.decode(sys.getfilesystemencoding())
+            if mask & self.IN_IGNORED:
+                self.codes.pop(wd, None)
+                continue
+            if mask & self.IN_Q_OVERFLOW:
+                events.append((None, mask, name))
+                continue
+            if wd not in self.codes:
+                continue
+            events.append((self.codes[wd], mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)